@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+'''
+Benchmark suite for libwine, running against a stub Wine runner so that
+it doesn't need Wine installed. The stub wine64 answers `reg query` and
+`winedbg` with canned output, the wineprefix has synthetic hives.
+
+    python benchmarks/run.py --output results.json
+'''
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libwine import registry, runner  # noqa: E402
+from libwine.utils.command import Command  # noqa: E402
+from libwine.wine import Wine  # noqa: E402
+
+_stub_wine = '''#!/bin/sh
+case "$1" in
+    --version) echo "wine-0.0 (libwine stub)" ;;
+    reg) [ "$2" = query ] && cat "{root}/reg_query.txt" ;;
+    winedbg) cat "{root}/winedbg.txt" ;;
+esac
+exit 0
+'''
+
+_stub_wineserver = '''#!/bin/sh
+exit 0
+'''
+
+_dll_overrides = "Software\\Wine\\DllOverrides"
+_dll_modes = ("native", "builtin", "native,builtin", "builtin,native")
+
+
+class ServerWine(Wine):
+    '''
+    Wine acting as if a wineserver was holding the wineprefix, so that
+    the registry is always accessed through the stub wine64.
+    '''
+
+    def wineserver_running(self):
+        return True
+
+
+def write_hive(path: str, root: str, keys: int, values: int):
+    '''
+    Write a synthetic hive with keys * values string values, plus a
+    DllOverrides key with values overrides.
+    '''
+    stamp = 1600000000
+    with open(path, "w") as f:
+        f.write("WINE REGISTRY Version 2\n")
+        f.write(f";; All keys relative to {root}\n\n#arch=win64\n")
+
+        for k in range(keys):
+            f.write(f"\n[Software\\\\Vendor{k % 97}\\\\Product{k}] {stamp}\n")
+            f.write("#time=1d6f0c1a2b3c4d5\n")
+            for v in range(values):
+                f.write(registry.dump_value(f"Value{v}", 1, f"data {k} {v}") + "\n")
+            f.write(registry.dump_value("Count", 4, k) + "\n")
+
+        f.write(f"\n[{_dll_overrides.replace(chr(92), chr(92) * 2)}] {stamp}\n")
+        f.write("#time=1d6f0c1a2b3c4d5\n")
+        for v in range(values):
+            f.write(registry.dump_value(f"dll{v}", 1, _dll_modes[v % 4]) + "\n")
+
+
+def build(root: str, keys: int, values: int):
+    '''
+    Build the stub runner and the synthetic wineprefix in root.
+
+    Return
+    ----------
+    tuple:
+        the winepath and the wineprefix
+    '''
+    winepath = os.path.join(root, "runner")
+    wineprefix = os.path.join(root, "prefix")
+
+    for d in ("bin", "lib", "lib64", "share/wine"):
+        os.makedirs(os.path.join(winepath, d))
+    for name, script in (("wine64", _stub_wine), ("wineserver", _stub_wineserver)):
+        path = os.path.join(winepath, "bin", name)
+        with open(path, "w") as f:
+            f.write(script.format(root=root))
+        os.chmod(path, 0o755)
+
+    os.makedirs(os.path.join(wineprefix, "drive_c", "windows", "temp"))
+    write_hive(os.path.join(wineprefix, "system.reg"), "\\\\Machine", keys, values)
+    write_hive(os.path.join(wineprefix, "user.reg"), "\\\\User\\\\S-1-5-21-0-0-0-1000", keys, values)
+
+    with open(os.path.join(root, "reg_query.txt"), "w") as f:
+        f.write(f"\r\nHKEY_CURRENT_USER\\{_dll_overrides}\r\n")
+        for v in range(values):
+            f.write(f"    dll{v}    REG_SZ    {_dll_modes[v % 4]}\r\n")
+        f.write("\r\n")
+
+    with open(os.path.join(root, "winedbg.txt"), "w") as f:
+        f.write(" pid      threads  executable (all id:s are in hex)\n")
+        for p in range(values):
+            f.write(" %08x %-8d 'process%d.exe'\n" % (0x20 + p * 8, p % 9 + 1, p))
+            f.write(" %08x %-8d \\_ 'child%d.exe'\n" % (0x24 + p * 8, 1, p))
+
+    return winepath, wineprefix
+
+
+def measure(func, iterations: int, setup=None):
+    '''
+    Time func, calling setup (untimed) before each iteration.
+
+    Return
+    ----------
+    dict:
+        the iterations and the min, mean, median and max times in seconds
+    '''
+    times = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return {
+        "iterations": iterations,
+        "min": min(times),
+        "mean": statistics.mean(times),
+        "median": statistics.median(times),
+        "max": max(times),
+    }
+
+
+def benchmarks(winepath: str, wineprefix: str):
+    '''
+    Get the benchmarks as (name, func, setup, iterations scale) tuples.
+    '''
+    wine = Wine(winepath, wineprefix)
+    server_wine = ServerWine(winepath, wineprefix)
+    key = f"HKEY_CURRENT_USER\\{_dll_overrides}"
+    pristine = {}
+    for hive in ("system.reg", "user.reg"):
+        with open(f"{wineprefix}/{hive}", "rb") as f:
+            pristine[hive] = f.read()
+
+    def restore_hives():
+        for hive, content in pristine.items():
+            with open(f"{wineprefix}/{hive}", "wb") as f:
+                f.write(content)
+
+    def batch(w):
+        with w.registry_batch():
+            for i in range(50):
+                w.override_dll(f"bench{i}", i % 4)
+
+    def cold_reg_list():
+        Wine(winepath, wineprefix).reg_list(key)
+
+    return [
+        ("wine_init", lambda: Wine(winepath, wineprefix), None, 100),
+        ("wine_init_uncached", lambda: Wine(winepath, wineprefix), runner.clear, 10),
+        ("reg_list_hive_cold", cold_reg_list, None, 1),
+        ("reg_list_hive", lambda: wine.reg_list(key), None, 10),
+        ("reg_list_command", lambda: server_wine.reg_list(key), None, 1),
+        ("override_dll_list_hive", wine.override_dll_list, None, 10),
+        ("override_dll_list_command", server_wine.override_dll_list, None, 1),
+        ("processes", wine.processes, None, 1),
+        ("processes_winedbg", lambda: server_wine._parse_winedbg(server_wine.execute(
+            argv=["winedbg", "--command", "info proc"], comunicate=True)), None, 1),
+        ("registry_batch_hive", lambda: batch(wine), restore_hives, 1),
+        ("registry_batch_regedit", lambda: batch(server_wine), None, 1),
+        ("command_spawn", lambda: Command(argv=["/bin/true"]).execute(), None, 1),
+        ("command_spawn_string", lambda: Command("/bin/true").execute(), None, 1),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the libwine benchmarks.")
+    parser.add_argument("--iterations", type=int, default=20,
+                        help="base number of iterations (default is 20)")
+    parser.add_argument("--keys", type=int, default=20000,
+                        help="number of keys in each synthetic hive (default is 20000)")
+    parser.add_argument("--values", type=int, default=10,
+                        help="number of values in each key (default is 10)")
+    parser.add_argument("--filter", default=None,
+                        help="only run the benchmarks containing this string")
+    parser.add_argument("--output", default=None,
+                        help="file to write the JSON results to (default is stdout)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="libwine-bench-")
+    try:
+        winepath, wineprefix = build(root, args.keys, args.values)
+        results = {}
+
+        # keep the commands output out of the JSON results
+        with contextlib.redirect_stdout(sys.stderr):
+            for name, func, setup, scale in benchmarks(winepath, wineprefix):
+                if args.filter and args.filter not in name:
+                    continue
+                print(f"running {name}")
+                results[name] = measure(func, args.iterations * scale, setup)
+    finally:
+        shutil.rmtree(root)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "keys": args.keys,
+        "values": args.values,
+        "results": results,
+    }
+
+    if args.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from .utils import procfs
+from .wine import Wine
+
+
+class AsyncWine:
+    '''
+    Create a new object of type AsyncWine exposing the methods of a Wine
+    object which run commands as coroutines, so that many wineprefixes
+    can be driven from a single event loop.
+
+    Parameters
+    ----------
+    wine : Wine
+        the Wine (or Proton) object
+    '''
+
+    wine = Wine
+
+    def __init__(self, wine: Wine):
+        self.wine = wine
+
+    async def execute(self, command: str = None, comunicate: bool = False, envs: dict = None, terminal: str = None,
+                      cwd: str = None, argv: list = None):
+        '''
+        Execute command inside wineprefix using the wine in winepath,
+        see Wine.execute.
+
+        Return
+        ------
+        asyncio.subprocess.Process:
+            the subprocess object, await its wait() for the exit code.
+        str:
+            the command output if comunicate is set to True.
+        '''
+        cmd = self.wine._command(command, envs or {}, terminal, cwd, argv)
+        return await cmd.execute_async(comunicate=comunicate)
+
+    '''
+    Wine uptime management
+    '''
+
+    async def __wineboot(self, status: int, silent: bool = True):
+        '''
+        Manage Wine server uptime using wineboot and wait for it to exit.
+
+        Return
+        ------
+        int:
+            the wineboot exit code.
+        '''
+        argv, envs = self.wine._wineboot_command(status, silent)
+        proc = await self.execute(argv=argv, envs=envs)
+        return await proc.wait()
+
+    async def kill(self):
+        '''
+        Kill all processes running inside the wineprefix.
+        '''
+        return await self.__wineboot(status=0)
+
+    async def restart(self):
+        '''
+        Simulate system restart for the wineprefix,
+        don't do normal startup operations.
+        '''
+        return await self.__wineboot(status=1)
+
+    async def shutdown(self):
+        '''
+        Simulate system shutdown for the wineprefix, don't reboot.
+        '''
+        return await self.__wineboot(status=2)
+
+    async def update(self):
+        '''
+        Update the wineprefix directory.
+        '''
+        return await self.__wineboot(status=3, silent=True)
+
+    '''
+    Wine process management
+    '''
+
+    async def processes(self):
+        '''
+        Get processes running on the wineprefix, see Wine.processes.
+
+        Return
+        ------
+        list:
+            A list of WineProcess.
+        '''
+        if procfs.available():
+            return self.wine._procfs_processes()
+
+        winedbg = await self.execute(
+            argv=["winedbg", "--command", "info proc"],
+            comunicate=True)
+
+        return self.wine._parse_winedbg(winedbg)
+
+    '''
+    Wine register management
+    '''
+
+    async def reg_list(self, key: str):
+        '''
+        List all keys values from the wineprefix register,
+        see Wine.reg_list.
+
+        Return
+        ------
+        list:
+            A list of key values.
+        '''
+        values = self.wine._reg_list_offline(key)
+        if values is not None:
+            return values
+
+        output = await self.execute(
+            argv=["reg", "query", key, "/f"],
+            comunicate=True)
+
+        return self.wine._parse_reg_query(output)
@@ -0,0 +1,248 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from stat import S_ISREG
+
+from .utils import clone
+
+
+class Deduplicator:
+    '''
+    Create a new object of type Deduplicator to share identical files
+    between many wineprefixes. Files are grouped by size, hashed in
+    parallel and the duplicates are replaced with reflinks. Where
+    reflinks are not supported the duplicates are kept, unless hard
+    links are allowed.
+
+    Parameters
+    ----------
+    wineprefixes : list
+        full paths to the wineprefixes
+    paths : list, optional
+        directories to scan, relative to each wineprefix (default is
+        system32 and syswow64)
+    index : str, optional
+        full path to the hash index file, reused on the next runs to skip
+        hashing the files which didn't change (default is no index)
+    workers : int, optional
+        number of files hashed in parallel (default is 4)
+    hardlink : bool, optional
+        if duplicates can be hard linked when reflinks are not supported.
+        Hard linked files are a single inode: a program writing one of
+        them in place (an installer patching a dll) changes it in every
+        wineprefix sharing it. Only use it for wineprefixes which never
+        modify these files (default False)
+    '''
+
+    _wineprefixes = list
+    _paths = [
+        "drive_c/windows/system32",
+        "drive_c/windows/syswow64",
+    ]
+    _index = str
+    _workers = int
+    _hardlink = bool
+
+    def __init__(self, wineprefixes: list, paths: list = None, index: str = None, workers: int = 4, hardlink: bool = False):
+        self._wineprefixes = wineprefixes
+        self._index = index
+        self._workers = workers
+        self._hardlink = hardlink
+
+        if paths is not None:
+            self._paths = paths
+
+    '''
+    Hash index
+    '''
+
+    def __load_index(self):
+        '''
+        Load the hash index, keyed on "dev:inode:size:mtime".
+
+        Return
+        ----------
+        dict:
+            the file keys mapped to [digest, cloned], cloned is True for
+            the files already replaced by a previous run
+        '''
+        if self._index is None or not os.path.isfile(self._index):
+            return {}
+
+        try:
+            with open(self._index, "r") as f:
+                return json.load(f)["files"]
+        except (ValueError, KeyError):
+            return {}
+
+    def __save_index(self, files: dict):
+        if self._index is None:
+            return
+
+        tmp = f"{self._index}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "files": files}, f)
+        os.replace(tmp, self._index)
+
+    @staticmethod
+    def _key(stat: os.stat_result):
+        return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    '''
+    Scan
+    '''
+
+    def __scan(self):
+        '''
+        List the regular files in the scanned paths of all wineprefixes.
+
+        Return
+        ----------
+        list:
+            (path, stat) tuples
+        '''
+        files = []
+
+        for wineprefix in self._wineprefixes:
+            for rel in self._paths:
+                for root, _, names in os.walk(os.path.join(wineprefix, rel)):
+                    for name in names:
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.lstat(path)
+                        except FileNotFoundError:
+                            # removed since the directory was listed
+                            continue
+                        if S_ISREG(stat.st_mode) and stat.st_size > 0:
+                            files.append((path, stat))
+
+        return files
+
+    @staticmethod
+    def __hash(path: str):
+        '''
+        Hash a file, None if it can't be read anymore (removed or
+        made unreadable since the scan).
+        '''
+        try:
+            return clone.hash_file(path)
+        except OSError:
+            return None
+
+    '''
+    Deduplication
+    '''
+
+    def __replace(self, original: str, stat: os.stat_result, path: str, dup: os.stat_result):
+        '''
+        Replace path with a clone of original. Both must be on the same
+        device and have the same mode and owner, which a reflink copies
+        and a hard link shares.
+
+        Return
+        ----------
+        str:
+            reflink or hardlink, None if the file could not be replaced
+        '''
+        if (stat.st_dev, stat.st_mode, stat.st_uid, stat.st_gid) != \
+                (dup.st_dev, dup.st_mode, dup.st_uid, dup.st_gid):
+            return None
+
+        def create(tmp):
+            if clone.reflink(original, tmp):
+                return "reflink"
+            if self._hardlink:
+                os.link(original, tmp)
+                return "hardlink"
+            return None
+
+        try:
+            return clone.replace_file(path, create)
+        except FileNotFoundError:
+            # removed since the scan
+            return None
+
+    def run(self, dry_run: bool = False):
+        '''
+        Deduplicate the files of the wineprefixes.
+
+        Parameters
+        ----------
+        dry_run : bool, optional
+            only report what would be reclaimed (default False)
+
+        Return
+        ----------
+        dict:
+            the number of scanned, hashed, duplicate and replaced files
+            (reflinked and hard linked) and the reclaimed bytes
+        '''
+        index = self.__load_index()
+        files = self.__scan()
+        report = {
+            "files": len(files),
+            "hashed": 0,
+            "duplicates": 0,
+            "reflink": 0,
+            "hardlink": 0,
+            "reclaimed": 0,
+        }
+
+        # only files sharing their size can be duplicates
+        sizes = {}
+        for path, stat in files:
+            sizes.setdefault(stat.st_size, []).append((path, stat))
+        candidates = [f for group in sizes.values() if len(group) > 1 for f in group]
+
+        seen = {}
+        to_hash = {}
+        for path, stat in candidates:
+            key = self._key(stat)
+            if key in index:
+                seen[key] = index[key]
+            elif key not in to_hash:
+                to_hash[key] = path
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            digests = executor.map(self.__hash, to_hash.values())
+            for key, digest in zip(to_hash, digests):
+                if digest is not None:
+                    seen[key] = [digest, False]
+                    report["hashed"] += 1
+
+        # the files which couldn't be hashed are left alone
+        candidates = [f for f in candidates if self._key(f[1]) in seen]
+
+        groups = {}
+        for path, stat in candidates:
+            digest = seen[self._key(stat)][0]
+            groups.setdefault((stat.st_size, digest), []).append((path, stat))
+
+        links = {}
+        for (size, digest), group in groups.items():
+            # keep the most linked inode, hard links of it are already shared
+            group.sort(key=lambda f: -f[1].st_nlink)
+            original, stat = group[0]
+
+            for path, dup in group[1:]:
+                if dup.st_ino == stat.st_ino or seen[self._key(dup)][1]:
+                    continue
+                report["duplicates"] += 1
+
+                if not dry_run:
+                    method = self.__replace(original, stat, path, dup)
+                    if method is None:
+                        continue
+                    report[method] += 1
+                    seen[self._key(os.lstat(path))] = [digest, method == "reflink"]
+
+                # the space is reclaimed once all the links are replaced
+                inode = (dup.st_dev, dup.st_ino)
+                links[inode] = links.get(inode, dup.st_nlink) - 1
+                if links[inode] == 0:
+                    report["reclaimed"] += size
+
+        if not dry_run:
+            self.__save_index(seen)
+
+        return report
@@ -0,0 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import procfs
+from .wine import Wine
+from .wineprocess import WineProcess
+
+
+class WineFleet:
+    '''
+    Create a new object of type WineFleet to run the same operation on
+    many wineprefixes at once, with a bounded number of operations
+    running concurrently. Results and errors are collected per
+    wineprefix, an error on one wineprefix doesn't stop the others.
+
+    Parameters
+    ----------
+    prefixes : list
+        (winepath, wineprefix) pairs
+    workers : int, optional
+        number of operations running concurrently (default is 8)
+    verbose: int, optional
+        verbosity status of wine logs (default is 0), see Wine
+
+    Raises
+    ------
+    ValueError
+        If workers is lower than 1.
+    '''
+
+    _wines = dict
+    _invalid = dict
+    _workers = int
+
+    def __init__(self, prefixes: list, workers: int = 8, verbose: int = 0):
+        if workers < 1:
+            raise ValueError("Workers must be at least 1.")
+
+        self._wines = {}
+        self._invalid = {}
+        self._workers = workers
+
+        for winepath, wineprefix in prefixes:
+            try:
+                self._wines[wineprefix] = Wine(winepath, wineprefix, verbose)
+            except ValueError as e:
+                self._invalid[wineprefix] = e
+
+    def __len__(self):
+        return len(self._wines) + len(self._invalid)
+
+    def wines(self):
+        '''
+        Get the Wine objects of the valid wineprefixes.
+
+        Return
+        ------
+        dict:
+            the Wine objects by wineprefix.
+        '''
+        return dict(self._wines)
+
+    def run(self, operation, *args, **kwargs):
+        '''
+        Run an operation on every wineprefix.
+
+        Parameters
+        ----------
+        operation : str or callable
+            the name of a Wine method, or a callable taking the Wine
+            object as first argument
+        args, kwargs
+            the arguments passed to the operation
+
+        Return
+        ------
+        tuple:
+            two dicts by wineprefix: the results of the operation and the
+            exceptions raised (wineprefixes with an invalid winepath are
+            reported here too).
+        '''
+        if isinstance(operation, str):
+            name = operation
+
+            def operation(wine, *args, **kwargs):
+                return getattr(wine, name)(*args, **kwargs)
+
+        results = {}
+        errors = dict(self._invalid)
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {
+                wineprefix: executor.submit(operation, wine, *args, **kwargs)
+                for wineprefix, wine in self._wines.items()
+            }
+            for wineprefix, future in futures.items():
+                try:
+                    results[wineprefix] = future.result()
+                except Exception as e:
+                    errors[wineprefix] = e
+
+        return results, errors
+
+    '''
+    Wine uptime management
+    '''
+
+    def update(self):
+        '''
+        Update the wineprefixes directory, see Wine.update.
+        '''
+        return self.run("update")
+
+    def kill(self):
+        '''
+        Kill all processes running inside the wineprefixes, see Wine.kill.
+        '''
+        return self.run("kill")
+
+    '''
+    Wine process management
+    '''
+
+    def processes(self):
+        '''
+        Get processes running on the wineprefixes. When /proc is
+        available, it is scanned once for all the wineprefixes.
+
+        Return
+        ------
+        tuple:
+            the lists of WineProcess and the errors, by wineprefix.
+        '''
+        if not procfs.available():
+            return self.run("processes")
+
+        found = procfs.scan(list(self._wines))
+        results = {
+            wineprefix: [
+                WineProcess(
+                    pid=None,
+                    name=p["name"],
+                    wine=wine,
+                    unix_pid=p["pid"],
+                    unix_ppid=p["ppid"],
+                    threads=p["threads"]
+                )
+                for p in found[wineprefix]
+            ]
+            for wineprefix, wine in self._wines.items()
+        }
+
+        return results, dict(self._invalid)
+
+    '''
+    Wine register management
+    '''
+
+    def reg_list(self, key: str):
+        '''
+        List all keys values from the wineprefixes register,
+        see Wine.reg_list.
+        '''
+        return self.run("reg_list", key)
+
+    def set_windows(self, version: str):
+        '''
+        Change Windows version of the wineprefixes, see Wine.set_windows.
+        '''
+        return self.run("set_windows", version)
+
+    def override_dll(self, name: str, override: int = 0, restore: bool = False, executable: str = None):
+        '''
+        Overriding a DLL in the wineprefixes, see Wine.override_dll.
+        '''
+        return self.run("override_dll", name, override, restore, executable)
+
+    def override_dlls(self, overrides: dict = None, restore: list = None, executable: str = None):
+        '''
+        Override and restore many DLLs in the wineprefixes, with a single
+        registry transaction per wineprefix, see Wine.override_dlls.
+        '''
+        return self.run("override_dlls", overrides, restore, executable)
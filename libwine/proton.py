@@ -1,4 +1,5 @@
 from .wine import Wine
+from . import registry, runner
 
 
 class Proton(Wine):
@@ -27,14 +28,18 @@ class Proton(Wine):
     _winepath = str
     _wineprefix = str
     _verbose = int
+    _hives = registry.HiveCache
+    _runner = runner.Runner
 
     def __init__(self, protonpath: str, wineprefix: str, verbose: int = 0):
         self._winepath = f"{protonpath}/dist"
         self._wineprefix = wineprefix
+        self._hives = registry.HiveCache(wineprefix)
 
         if verbose in self._verbose_levels:
             self._verbose = verbose
 
-        if not self.validate_winepath():
+        self._runner = runner.get(self._winepath)
+        if not self._runner.valid:
             raise ValueError(
                 "Given protonpath doesn't seem a valid Proton path.")
@@ -0,0 +1,312 @@
+import os
+import re
+
+from . import registry
+
+# the header timestamp and the #time line change whenever wineserver
+# touches a key, even if its values are the same (value lines never end
+# with "] <digits>")
+_stamps_re = re.compile(rb"\] [0-9]+\n(?:#time=[0-9a-fA-F]+\n)?")
+
+_hive_names = {
+    "system.reg": "HKEY_LOCAL_MACHINE",
+    "user.reg": "HKEY_CURRENT_USER",
+    "userdef.reg": "HKEY_USERS\\.DEFAULT",
+}
+
+
+class RegistryChange:
+    '''
+    Create a new object of type RegistryChange, a difference between
+    two registries.
+
+    Parameters
+    ----------
+    kind : str
+        key_added, key_removed, value_added, value_removed or
+        value_changed
+    key : str
+        the full key name
+    value : str, optional
+        the value name ("" is the default value), None for the key changes
+    old : RegValue, optional
+        the old value
+    new : RegValue, optional
+        the new value
+    '''
+
+    kind = str
+    key = str
+    value = None
+    old = None
+    new = None
+
+    def __init__(self, kind: str, key: str, value: str = None, old: registry.RegValue = None,
+                 new: registry.RegValue = None):
+        self.kind = kind
+        self.key = key
+        self.value = value
+        self.old = old
+        self.new = new
+
+    def __repr__(self):
+        if self.value is None:
+            return f"<RegistryChange {self.kind} {self.key}>"
+        return f"<RegistryChange {self.kind} {self.key} {self.value or '@'}>"
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "key": self.key,
+            "value": self.value,
+            "old": self.old,
+            "new": self.new,
+        }
+
+
+class HiveDiff:
+    '''
+    Create a new object of type HiveDiff comparing two registry files.
+
+    Both files are compared as raw bytes (key timestamps excluded) in
+    large blocks, only the keys inside a differing block are split and
+    only the differing keys are decoded, so that unchanged parts of the
+    hives cost a memory comparison.
+
+    Parameters
+    ----------
+    old_path : str
+        full path to the old .reg file (None or missing for an empty hive)
+    new_path : str
+        full path to the new .reg file (None or missing for an empty hive)
+    root : str, optional
+        the name of the hive root, prepended to the key names
+        (e.g. HKEY_CURRENT_USER)
+    '''
+
+    _root = str
+    _block_size = 64 * 1024
+    _window = 1024 * 1024
+
+    def __init__(self, old_path: str, new_path: str, root: str = ""):
+        self._root = root
+        self._old = self.__load(old_path)
+        self._new = self.__load(new_path)
+
+    @staticmethod
+    def __load(path: str):
+        '''
+        Read a hive without the key timestamps, starting at the first
+        key header.
+        '''
+        if path is None or not os.path.isfile(path):
+            return b""
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        data = _stamps_re.sub(b"]\n", data)
+        start = data.find(b"\n[")
+        if start < 0:
+            return b""
+        return data[start:].rstrip(b"\n") + b"\n"
+
+    '''
+    Sections
+    '''
+
+    @staticmethod
+    def __section(data: bytes, pos: int):
+        '''
+        Get the key of the section starting at pos (a "\n[" sequence).
+
+        Return
+        ----------
+        tuple:
+            the escaped key, the start of the values and the end of the
+            section
+        '''
+        start = data.find(b"\n", pos + 1)
+        if start < 0:
+            start = len(data)
+        end = data.find(b"\n[", start)
+        if end < 0:
+            end = len(data)
+
+        header = data[pos + 2:start]
+        return header[:header.rfind(b"]")], start + 1, end
+
+    def __key_name(self, key: bytes):
+        name = registry._header_name(key.decode("utf-8", "surrogateescape") + "]")[0]
+        return "\\".join(p for p in (self._root, name) if p)
+
+    @staticmethod
+    def __values(data: bytes, start: int, end: int):
+        text = data[start:end].decode("utf-8", "surrogateescape")
+        return {v.name.lower(): v for v in registry.parse_values(text)}
+
+    def __common(self, i: int, j: int):
+        '''
+        Get the length of the identical bytes at i (old) and j (new).
+        '''
+        old, new = self._old, self._new
+        size = self._block_size
+        start = i
+
+        while old[i:i + size] == new[j:j + size]:
+            if i + size >= len(old):
+                return len(old) - start
+            i += size
+            j += size
+
+        # binary search of the first difference inside the block
+        low, high = 0, size
+        while high - low > 1:
+            mid = (low + high) // 2
+            if old[i:i + mid] == new[j:j + mid]:
+                low = mid
+            else:
+                high = mid
+
+        return i - start + low
+
+    '''
+    Changes
+    '''
+
+    def __key_changes(self, kind: str, data: bytes, key: bytes, start: int, end: int):
+        name = self.__key_name(key)
+        yield RegistryChange(f"key_{kind}", name)
+
+        for value in self.__values(data, start, end).values():
+            if kind == "added":
+                yield RegistryChange("value_added", name, value.name, new=value)
+            else:
+                yield RegistryChange("value_removed", name, value.name, old=value)
+
+    def __value_changes(self, key: bytes, old: tuple, new: tuple):
+        '''
+        Compare the values of a key present in both hives.
+        '''
+        if self._old[old[0]:old[1]] == self._new[new[0]:new[1]]:
+            return
+
+        name = self.__key_name(key)
+        old_values = self.__values(self._old, *old)
+        new_values = self.__values(self._new, *new)
+
+        for lower, value in old_values.items():
+            other = new_values.get(lower)
+            if other is None:
+                yield RegistryChange("value_removed", name, value.name, old=value)
+            elif other.reg_type != value.reg_type or other.data != value.data:
+                yield RegistryChange("value_changed", name, other.name, old=value, new=other)
+
+        for lower, value in new_values.items():
+            if lower not in old_values:
+                yield RegistryChange("value_added", name, value.name, new=value)
+
+    def changes(self):
+        '''
+        Iterate over the differences, as RegistryChange objects. The keys
+        are walked in the order of the files, keys moved elsewhere in the
+        file are reported last.
+        '''
+        old, new = self._old, self._new
+        i, j = 0, 0
+        # sections not matched yet: escaped lower case key to (key, start, end)
+        pending_old, pending_new = {}, {}
+
+        while i < len(old) and j < len(new):
+            common = self.__common(i, j)
+            if i + common >= len(old) and j + common >= len(new):
+                i, j = len(old), len(new)
+                break
+
+            # back to the start of the section holding the difference,
+            # the previous sections are the same in both hives
+            start = old.rfind(b"\n[", i, i + common)
+            if start > i:
+                j += start - i
+                i = start
+
+            key_old, start_old, end_old = self.__section(old, i)
+            key_new, start_new, end_new = self.__section(new, j)
+            lower_old, lower_new = key_old.lower(), key_new.lower()
+
+            if lower_old == lower_new:
+                yield from self.__value_changes(key_old, (start_old, end_old), (start_new, end_new))
+                i, j = end_old, end_new
+            elif lower_old in pending_new:
+                key, start, end = pending_new.pop(lower_old)
+                yield from self.__value_changes(key_old, (start_old, end_old), (start, end))
+                i = end_old
+            elif lower_new in pending_old:
+                key, start, end = pending_old.pop(lower_new)
+                yield from self.__value_changes(key_new, (start, end), (start_new, end_new))
+                j = end_new
+            elif old.find(b"\n[" + key_new + b"]\n", i, i + self._window) >= 0:
+                # the new key is further in the old hive, the old one
+                # was removed (or moved)
+                pending_old[lower_old] = (key_old, start_old, end_old)
+                i = end_old
+            elif new.find(b"\n[" + key_old + b"]\n", j, j + self._window) >= 0:
+                pending_new[lower_new] = (key_new, start_new, end_new)
+                j = end_new
+            else:
+                pending_old[lower_old] = (key_old, start_old, end_old)
+                pending_new[lower_new] = (key_new, start_new, end_new)
+                i, j = end_old, end_new
+
+        for data, pending, pos in ((old, pending_old, i), (new, pending_new, j)):
+            while pos < len(data):
+                key, start, end = self.__section(data, pos)
+                pending[key.lower()] = (key, start, end)
+                pos = end
+
+        for lower, (key, start, end) in pending_old.items():
+            other = pending_new.pop(lower, None)
+            if other is None:
+                yield from self.__key_changes("removed", old, key, start, end)
+            else:
+                yield from self.__value_changes(key, (start, end), other[1:])
+
+        for key, start, end in pending_new.values():
+            yield from self.__key_changes("added", new, key, start, end)
+
+
+def diff_hives(old_path: str, new_path: str, root: str = ""):
+    '''
+    Iterate over the differences between two registry files, see
+    HiveDiff.
+    '''
+    return HiveDiff(old_path, new_path, root).changes()
+
+
+def diff_registries(old: dict, new: dict):
+    '''
+    Iterate over the differences between two sets of hives.
+
+    Parameters
+    ----------
+    old : dict
+        the old hive file names (system.reg, user.reg, userdef.reg)
+        mapped to their full paths
+    new : dict
+        the new hive file names mapped to their full paths
+
+    Return
+    ----------
+    generator:
+        RegistryChange objects, hive by hive
+    '''
+    for name, root in _hive_names.items():
+        if name in old or name in new:
+            yield from diff_hives(old.get(name), new.get(name), root)
+
+
+def wineprefix_hives(wineprefix: str):
+    '''
+    Get the hive files of a wineprefix, as expected by diff_registries.
+    '''
+    return {name: os.path.join(wineprefix, name) for name in _hive_names}
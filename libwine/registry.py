@@ -0,0 +1,1161 @@
+import mmap
+import os
+import re
+import string
+import tempfile
+import time
+
+_hive_roots = {
+    "HKEY_LOCAL_MACHINE": ("system.reg", ""),
+    "HKLM": ("system.reg", ""),
+    "HKEY_CLASSES_ROOT": ("system.reg", "Software\\Classes"),
+    "HKCR": ("system.reg", "Software\\Classes"),
+    "HKEY_CURRENT_USER": ("user.reg", ""),
+    "HKCU": ("user.reg", ""),
+    "HKEY_USERS\\.DEFAULT": ("userdef.reg", ""),
+    "HKU\\.DEFAULT": ("userdef.reg", ""),
+}
+
+_reg_types = {
+    0x0: "REG_NONE",
+    0x1: "REG_SZ",
+    0x2: "REG_EXPAND_SZ",
+    0x3: "REG_BINARY",
+    0x4: "REG_DWORD",
+    0x7: "REG_MULTI_SZ",
+    0xb: "REG_QWORD",
+}
+
+_escapes = {
+    "a": "\a",
+    "b": "\b",
+    "e": "\x1b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+}
+
+_control_escapes = {ord(v): k for k, v in _escapes.items()}
+
+_reg_type_ids = {v: k for k, v in _reg_types.items()}
+
+# UTF-16 surrogates, written escaped one by one by wineserver
+_surrogates_re = re.compile("[\ud800-\udfff]")
+
+# seconds between 1601-01-01 (FILETIME epoch) and 1970-01-01
+_filetime_epoch = 11644473600
+
+_root_names = {
+    "HKLM": "HKEY_LOCAL_MACHINE",
+    "HKCU": "HKEY_CURRENT_USER",
+    "HKCR": "HKEY_CLASSES_ROOT",
+    "HKU": "HKEY_USERS",
+    "HKCC": "HKEY_CURRENT_CONFIG",
+}
+
+
+def split_key(key: str):
+    '''
+    Split a full registry key in the hive file name and the key path
+    relative to the hive root.
+
+    Parameters
+    ----------
+    key : str
+        the full key name (e.g. HKEY_CURRENT_USER\\Software\\Wine)
+
+    Return
+    ----------
+    tuple:
+        the hive file name and the relative key, or None if the root
+        key is not stored in the wineprefix hives
+    '''
+    key = key.replace("/", "\\").strip("\\")
+    upper = key.upper()
+
+    for root in sorted(_hive_roots, key=len, reverse=True):
+        if upper == root or upper.startswith(f"{root}\\"):
+            hive, base = _hive_roots[root]
+            rel = key[len(root) + 1:]
+            rel = "\\".join(p for p in (base, rel) if p)
+            return hive, rel
+
+    return None
+
+
+def normalize_key(key: str):
+    '''
+    Get the lookup form of a relative key (keys are case insensitive).
+    '''
+    return "\\".join(p for p in key.lower().split("\\") if p)
+
+
+def index_key(key: str):
+    '''
+    Get the form of a relative key used to look it up in the hive index,
+    that is how the key is written in the [key] header, lower case.
+    '''
+    return escape_string(normalize_key(key), "[]").encode("ascii").lower()
+
+
+def escape_string(value: str, delimiters: str):
+    '''
+    Escape a string the way wineserver does when saving the registry.
+
+    Parameters
+    ----------
+    value : str
+        the string to be escaped
+    delimiters : str
+        the delimiters of the field ("[]" for keys, '""' for values)
+
+    Return
+    ----------
+    str:
+        the escaped string
+    '''
+    if any(ord(c) > 0xffff for c in value):
+        # wineserver escapes UTF-16 code units, split the surrogate pairs
+        units = value.encode("utf-16-le")
+        value = "".join(
+            chr(int.from_bytes(units[i:i + 2], "little"))
+            for i in range(0, len(units), 2))
+
+    out = []
+    size = len(value)
+
+    for i, c in enumerate(value):
+        code = ord(c)
+        following = value[i + 1] if i + 1 < size else ""
+
+        if code > 127:
+            if following and ord(following) < 128 and following in string.hexdigits:
+                out.append("\\x%04x" % code)
+            else:
+                out.append("\\x%x" % code)
+        elif code < 32:
+            if code in _control_escapes:
+                out.append("\\" + _control_escapes[code])
+            elif following and following in "01234567":
+                out.append("\\%03o" % code)
+            else:
+                out.append("\\%o" % code)
+        else:
+            if c == "\\" or c in delimiters:
+                out.append("\\")
+            out.append(c)
+
+    return "".join(out)
+
+
+def parse_string(line: str, pos: int, end: str):
+    '''
+    Unescape a string as written by wineserver.
+
+    Parameters
+    ----------
+    line : str
+        the line containing the string
+    pos : int
+        the position of the first character after the opening delimiter
+    end : str
+        the closing delimiter
+
+    Return
+    ----------
+    tuple:
+        the unescaped string and the position after the closing delimiter
+    '''
+    out = []
+    size = len(line)
+
+    while pos < size:
+        # copy the characters up to the next escape or the delimiter
+        close = line.find(end, pos)
+        slash = line.find("\\", pos, size if close < 0 else close)
+        if slash < 0:
+            if close < 0:
+                break
+            out.append(line[pos:close])
+            value = "".join(out)
+            if _surrogates_re.search(value):
+                value = value.encode("utf-16-le", "surrogatepass").decode(
+                    "utf-16-le", "surrogatepass")
+            return value, close + 1
+
+        out.append(line[pos:slash])
+        pos = slash + 1
+        if pos >= size:
+            break
+        c = line[pos]
+
+        if c in _escapes:
+            out.append(_escapes[c])
+            pos += 1
+        elif c == "x":
+            digits = ""
+            pos += 1
+            while pos < size and len(digits) < 4 and line[pos] in "0123456789abcdefABCDEF":
+                digits += line[pos]
+                pos += 1
+            out.append(chr(int(digits, 16)) if digits else "x")
+        elif c in "01234567":
+            digits = ""
+            while pos < size and len(digits) < 3 and line[pos] in "01234567":
+                digits += line[pos]
+                pos += 1
+            out.append(chr(int(digits, 8)))
+        else:
+            out.append(c)
+            pos += 1
+
+    raise ValueError(f"Unterminated string in registry line: {line}")
+
+
+def decode_value(raw: str):
+    '''
+    Decode the data part of a value line.
+
+    Parameters
+    ----------
+    raw : str
+        everything after the = sign, continuation lines already joined
+
+    Return
+    ----------
+    tuple:
+        the registry type (as int) and the decoded data (str, int, list
+        or bytes)
+    '''
+    if raw.startswith('"'):
+        return 0x1, parse_string(raw, 1, '"')[0]
+
+    if raw.startswith("str("):
+        close = raw.index(")")
+        reg_type = int(raw[4:close], 16)
+        data = parse_string(raw, close + 3, '"')[0]
+        if reg_type == 0x7:
+            return reg_type, [s for s in data.split("\0") if s]
+        return reg_type, data
+
+    if raw.startswith("dword:"):
+        return 0x4, int(raw[6:], 16)
+
+    if raw.startswith("hex"):
+        reg_type = 0x3
+        colon = raw.index(":")
+        if raw[3] == "(":
+            reg_type = int(raw[4:raw.index(")")], 16)
+        data = raw[colon + 1:].replace("\\", "").replace(" ", "")
+        data = bytes(int(b, 16) for b in data.split(",") if b)
+
+        if reg_type in (0x1, 0x2):
+            return reg_type, data.decode("utf-16-le").rstrip("\0")
+        if reg_type == 0x7:
+            data = data.decode("utf-16-le")
+            return reg_type, [s for s in data.split("\0") if s]
+        if reg_type == 0x4 and len(data) == 4:
+            return reg_type, int.from_bytes(data, "little")
+        if reg_type == 0xb and len(data) == 8:
+            return reg_type, int.from_bytes(data, "little")
+        return reg_type, data
+
+    raise ValueError(f"Unsupported registry value: {raw}")
+
+
+def coerce_data(data_type: str, data):
+    '''
+    Convert data given in the `reg add /d` form to its decoded form.
+
+    Parameters
+    ----------
+    data_type : str
+        the type name (e.g. REG_DWORD)
+    data : str
+        the data, as it would be passed to `reg add`
+
+    Return
+    ----------
+    tuple:
+        the registry type (as int) and the decoded data
+    '''
+    reg_type = _reg_type_ids[data_type]
+
+    if reg_type in (0x4, 0xb):
+        if not isinstance(data, int):
+            data = int(str(data), 0)
+    elif reg_type == 0x7:
+        if not isinstance(data, list):
+            data = [s for s in str(data).split("\\0") if s]
+    elif reg_type == 0x3:
+        if not isinstance(data, bytes):
+            data = bytes.fromhex(str(data))
+    elif not isinstance(data, bytes):
+        data = "" if data is None else str(data)
+
+    return reg_type, data
+
+
+def encode_data(reg_type: int, data):
+    '''
+    Get the raw bytes of a decoded value, as stored by Windows.
+    '''
+    if isinstance(data, bytes):
+        return data
+    if reg_type == 0x4:
+        return data.to_bytes(4, "little")
+    if reg_type == 0xb:
+        return data.to_bytes(8, "little")
+    if reg_type == 0x7:
+        return "".join(f"{s}\0" for s in data + [""]).encode("utf-16-le")
+    return f"{data}\0".encode("utf-16-le")
+
+
+def export_value(reg_type: int, data):
+    '''
+    Format a decoded value for a regedit (.reg) import file.
+    '''
+    if reg_type == 0x1 and isinstance(data, str) and data.isprintable():
+        data = data.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{data}"'
+
+    if reg_type == 0x4 and isinstance(data, int):
+        return "dword:%08x" % data
+
+    raw = ",".join("%02x" % b for b in encode_data(reg_type, data))
+    if reg_type == 0x3:
+        return f"hex:{raw}"
+    return "hex(%x):%s" % (reg_type, raw)
+
+
+def dump_value(name: str, reg_type: int, data):
+    '''
+    Format a value line exactly as wineserver saves it in the hive files.
+
+    Parameters
+    ----------
+    name : str
+        the value name (empty for the default value)
+    reg_type : int
+        the registry type
+    data : str, int, list or bytes
+        the decoded data
+
+    Return
+    ----------
+    str:
+        the value line (hex data can span more lines)
+    '''
+    if name:
+        head = '"%s"=' % escape_string(name, '""')
+    else:
+        head = "@="
+
+    raw = encode_data(reg_type, data)
+
+    if reg_type in (0x1, 0x2, 0x7) and len(raw) >= 2 and not len(raw) % 2 \
+            and raw[-2:] == b"\0\0":
+        text = raw[:-2].decode("utf-16-le", "surrogatepass")
+        prefix = "" if reg_type == 0x1 else "str(%x):" % reg_type
+        return '%s%s"%s"' % (head, prefix, escape_string(text, '""'))
+
+    if reg_type == 0x4 and len(raw) == 4:
+        return "%sdword:%08x" % (head, int.from_bytes(raw, "little"))
+
+    prefix = "hex:" if reg_type == 0x3 else "hex(%x):" % reg_type
+    out = [head, prefix]
+    count = len(head) + len(prefix)
+
+    for i, b in enumerate(raw):
+        out.append("%02x" % b)
+        count += 2
+        if i < len(raw) - 1:
+            out.append(",")
+            count += 1
+            if count > 76:
+                out.append("\\\n  ")
+                count = 2
+
+    return "".join(out)
+
+
+def format_value(name: str, reg_type: int, data):
+    '''
+    Format a decoded value the way `reg query` prints it.
+
+    Return
+    ----------
+    list:
+        the value name, the type name and the data as string
+    '''
+    if not name:
+        name = "(Default)"
+
+    if isinstance(data, list):
+        data = "\\0".join(data)
+    elif isinstance(data, bytes):
+        data = data.hex().upper()
+    elif isinstance(data, int):
+        data = hex(data)
+
+    return [name, _reg_types.get(reg_type, "REG_NONE"), data]
+
+
+class RegValue:
+    '''
+    Create a new object of type RegValue, a typed registry value.
+
+    Parameters
+    ----------
+    name : str
+        the value name (empty for the default value)
+    reg_type : int
+        the registry type (e.g. 0x4 for REG_DWORD)
+    data : str, int, bytes or list
+        the decoded data: str for REG_SZ and REG_EXPAND_SZ, int for
+        REG_DWORD and REG_QWORD, list for REG_MULTI_SZ, bytes otherwise
+    '''
+
+    __slots__ = ("name", "reg_type", "data")
+
+    def __init__(self, name: str, reg_type: int, data):
+        self.name = name
+        self.reg_type = reg_type
+        self.data = data
+
+    def __repr__(self):
+        return f"<RegValue {self.name or '@'} {self.type_name} {self.data!r}>"
+
+    def __eq__(self, other):
+        if not isinstance(other, RegValue):
+            return NotImplemented
+        return self.name.lower() == other.name.lower() \
+            and self.reg_type == other.reg_type and self.data == other.data
+
+    @property
+    def type_name(self):
+        '''
+        Get the type name (e.g. REG_DWORD).
+        '''
+        return _reg_types.get(self.reg_type, "REG_NONE")
+
+    def as_list(self):
+        '''
+        Get the value the way `reg query` prints it, see format_value.
+        '''
+        return format_value(self.name, self.reg_type, self.data)
+
+
+def query_value(name: str, type_name: str, text: str):
+    '''
+    Decode a value printed by `reg query`, which uses the `reg add /d`
+    form of the data (see coerce_data).
+
+    Parameters
+    ----------
+    name : str
+        the value name, (Default) for the default value
+    type_name : str
+        the type name (e.g. REG_DWORD)
+    text : str
+        the printed data
+
+    Return
+    ----------
+    RegValue:
+        the decoded value
+    '''
+    if name == "(Default)":
+        name = ""
+
+    if type_name not in _reg_type_ids:
+        return RegValue(name, 0x0, text)
+
+    return RegValue(name, *coerce_data(type_name, text))
+
+
+def parse_values(text: str):
+    '''
+    Parse the value lines of a single key section.
+
+    Parameters
+    ----------
+    text : str
+        the section content, without the [key] header line
+
+    Return
+    ----------
+    list:
+        a list of RegValue
+    '''
+    values = []
+    pending = ""
+
+    for line in text.split("\n"):
+        if pending:
+            line = pending + line.lstrip()
+            pending = ""
+        if line.endswith("\\"):
+            pending = line[:-1]
+            continue
+
+        if line.startswith("@"):
+            name, pos = "", 1
+        elif line.startswith('"'):
+            name, pos = parse_string(line, 1, '"')
+        else:
+            continue
+
+        values.append(RegValue(name, *decode_value(line[pos + 1:])))
+
+    return values
+
+
+def parse_export(lines):
+    '''
+    Parse a regedit export (.reg) file line by line.
+
+    Parameters
+    ----------
+    lines : iterable
+        the lines of the file (e.g. the file object)
+
+    Return
+    ----------
+    generator:
+        (key, values) tuples, the full key name and the values as a list
+        of RegValue
+    '''
+    key = None
+    section = []
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.startswith("[") and line.endswith("]"):
+            if key is not None:
+                yield key, parse_values("\n".join(section))
+            key = line[1:-1]
+            section = []
+        elif key is not None:
+            section.append(line)
+
+    if key is not None:
+        yield key, parse_values("\n".join(section))
+
+
+class RegistryHive:
+    '''
+    Create a new object of type RegistryHive to read a Wine registry file
+    (system.reg, user.reg or userdef.reg) without running Wine.
+
+    The file is memory-mapped and indexed once (key path to the offset of
+    its header), values are only decoded for the keys being looked up.
+
+    Parameters
+    ----------
+    path : str
+        full path to the .reg file
+
+    Raises
+    ------
+    FileNotFoundError
+        If the given hive file doesn't exist.
+    '''
+
+    _path = str
+    _stat = tuple
+    _data = mmap.mmap
+    _index = dict
+
+    def __init__(self, path: str):
+        self._path = path
+        self._stat = self.__fingerprint()
+        self._index = None
+
+        with open(path, "rb") as f:
+            if self._stat[2] > 0:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = b""
+
+    def __fingerprint(self):
+        stat = os.stat(self._path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def __build_index(self):
+        '''
+        Map every key header (in its escaped, lower case form) to its offset.
+        '''
+        index = {}
+        data = self._data
+        find = data.find
+
+        pos = 0 if data[:1] == b"[" else find(b"\n[") + 1
+
+        while pos >= 0 and (pos or data[:1] == b"["):
+            end = find(b"]", pos)
+            # an escaped \] is part of the key name
+            while end > 0 and (end - pos - 1 - len(data[pos + 1:end].rstrip(b"\\"))) % 2:
+                end = find(b"]", end + 1)
+            if end < 0:
+                break
+
+            name = data[pos + 1:end]
+            if b"\\" in name.replace(b"\\\\", b""):
+                # \x escapes (non-ASCII characters) don't have the same
+                # case as the character they stand for
+                name = index_key(_header_name(name.decode("ascii", "surrogateescape") + "]")[0])
+            index[name.lower()] = pos
+
+            pos = find(b"\n[", end)
+            if pos >= 0:
+                pos += 1
+
+        self._index = index
+
+    def is_stale(self):
+        '''
+        Check if the hive file changed (or was replaced) since it was mapped.
+        '''
+        try:
+            return self.__fingerprint() != self._stat
+        except FileNotFoundError:
+            return True
+
+    def close(self):
+        '''
+        Release the memory map.
+        '''
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b""
+        self._index = {}
+
+    def values(self, key: str):
+        '''
+        Get all the values stored in a key.
+
+        Parameters
+        ----------
+        key : str
+            the key path relative to the hive root
+
+        Return
+        ----------
+        list:
+            a list of RegValue, None if the key doesn't exist
+        '''
+        if self._index is None:
+            self.__build_index()
+
+        pos = self._index.get(index_key(key))
+        if pos is None:
+            return None
+
+        return self.__section_values(self._data, pos)
+
+    @staticmethod
+    def __section_values(data, pos: int):
+        start = data.find(b"\n", pos) + 1
+        if start == 0:
+            return []
+
+        end = data.find(b"\n[", start - 1)
+        if end < 0:
+            end = len(data)
+
+        return parse_values(data[start:end].decode("utf-8", "surrogateescape"))
+
+    def walk(self, key: str, depth: int = None):
+        '''
+        Iterate over a key and all its subkeys stored in the hive, in
+        the order of the file. Only the keys being yielded are decoded.
+
+        Parameters
+        ----------
+        key : str
+            the key path relative to the hive root ("" for the whole hive)
+        depth : int, optional
+            how many levels of subkeys are walked (default is all, 0 only
+            walks the key itself)
+
+        Return
+        ----------
+        generator:
+            (key, values) tuples, the key relative to the hive root and
+            the values as a list of RegValue
+        '''
+        if self._index is None:
+            self.__build_index()
+
+        prefix = index_key(key)
+        # the escaped separator, as written in the headers
+        separator = b"\\\\"
+        data = self._data
+
+        for name, pos in self._index.items():
+            if prefix:
+                if name == prefix:
+                    level = 0
+                elif name.startswith(prefix + separator):
+                    level = name.count(separator, len(prefix) + 2) + 1
+                else:
+                    continue
+            else:
+                level = name.count(separator) + 1
+
+            if depth is not None and level > depth:
+                continue
+
+            end = data.find(b"\n", pos)
+            if end < 0:
+                end = len(data)
+            header = data[pos + 1:end].decode("utf-8", "surrogateescape")
+
+            yield _header_name(header)[0], self.__section_values(data, pos)
+
+
+class HiveCache:
+    '''
+    Create a new object of type HiveCache that keeps the hives of a
+    wineprefix mapped and indexed between lookups. A hive is dropped and
+    indexed again only when its file changes.
+
+    Parameters
+    ----------
+    wineprefix : str
+        full path to the wineprefix
+    '''
+
+    _wineprefix = str
+    _hives = dict
+
+    def __init__(self, wineprefix: str):
+        self._wineprefix = wineprefix
+        self._hives = {}
+
+    def hive(self, name: str):
+        '''
+        Get a hive of the wineprefix.
+
+        Parameters
+        ----------
+        name : str
+            the hive file name (e.g. user.reg)
+
+        Return
+        ----------
+        RegistryHive:
+            the hive, None if the file doesn't exist
+        '''
+        hive = self._hives.get(name)
+        if hive is not None:
+            if not hive.is_stale():
+                return hive
+            hive.close()
+            del self._hives[name]
+
+        path = os.path.join(self._wineprefix, name)
+        if not os.path.isfile(path):
+            return None
+
+        hive = RegistryHive(path)
+        self._hives[name] = hive
+        return hive
+
+    def read_key(self, key: str):
+        '''
+        Read a key straight from the wineprefix hive files.
+
+        Parameters
+        ----------
+        key : str
+            the full key name
+
+        Return
+        ----------
+        list:
+            the key values as RegValue, an empty list if the key doesn't
+            exist, None if the hive can't be read
+        '''
+        split = split_key(key)
+        if split is None:
+            return None
+
+        hive = self.hive(split[0])
+        if hive is None:
+            return None
+
+        values = hive.values(split[1])
+        if values is None:
+            return []
+
+        return values
+
+    def walk(self, key: str, depth: int = None):
+        '''
+        Walk a key and its subkeys straight from the wineprefix hive
+        files, see RegistryHive.walk.
+
+        Parameters
+        ----------
+        key : str
+            the full key name
+        depth : int, optional
+            how many levels of subkeys are walked (default is all)
+
+        Return
+        ----------
+        generator:
+            (key, values) tuples with the full key names, None if the
+            hive can't be read
+        '''
+        split = split_key(key)
+        if split is None:
+            return None
+
+        hive = self.hive(split[0])
+        if hive is None:
+            return None
+
+        root = key.replace("/", "\\").strip("\\")
+        skip = len(split[1])
+        return (
+            ("\\".join(p for p in (root, name[skip:].lstrip("\\")) if p), values)
+            for name, values in hive.walk(split[1], depth)
+        )
+
+    def clear(self):
+        '''
+        Release all the cached hives.
+        '''
+        for hive in self._hives.values():
+            hive.close()
+        self._hives = {}
+
+
+def read_key(wineprefix: str, key: str):
+    '''
+    Read a key straight from the wineprefix hive files, without caching.
+    See HiveCache.read_key.
+    '''
+    cache = HiveCache(wineprefix)
+    try:
+        return cache.read_key(key)
+    finally:
+        cache.clear()
+
+
+class RegistryBatch:
+    '''
+    Create a new object of type RegistryBatch that collects registry
+    changes, so that they can be applied with a single regedit import.
+    '''
+
+    _changes = list
+
+    def __init__(self):
+        self._changes = []
+
+    def __len__(self):
+        return len(self._changes)
+
+    def __iter__(self):
+        return iter(self._changes)
+
+    def add(self, key: str, value: str, data, data_type: str = "REG_SZ"):
+        '''
+        Add (or edit) a key value.
+
+        Parameters
+        ----------
+        key : str
+            the full key name
+        value : str
+            the key value
+        data : str
+            the data to store in the key value, as for `reg add`
+        data_type : str
+            the type name (default REG_SZ)
+        '''
+        if data_type not in _reg_type_ids:
+            raise ValueError("Given key type is not supported.")
+
+        reg_type, data = coerce_data(data_type, data)
+        self._changes.append((key, value, reg_type, data))
+
+    def delete(self, key: str, value: str):
+        '''
+        Delete a key value.
+
+        Parameters
+        ----------
+        key : str
+            the full key name
+        value : str
+            the key value to be removed
+        '''
+        self._changes.append((key, value, None, None))
+
+    def export(self):
+        '''
+        Get the collected changes as a regedit import file.
+
+        Return
+        ----------
+        str:
+            the .reg file content
+        '''
+        lines = ["Windows Registry Editor Version 5.00", ""]
+        last = None
+
+        for key, value, reg_type, data in self._changes:
+            root, _, rel = key.replace("/", "\\").strip("\\").partition("\\")
+            key = "\\".join(p for p in (_root_names.get(root.upper(), root), rel) if p)
+
+            if key != last:
+                if last is not None:
+                    lines.append("")
+                lines.append(f"[{key}]")
+                last = key
+
+            if value:
+                name = '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+            else:
+                name = "@"
+
+            if reg_type is None:
+                lines.append(f"{name}=-")
+            else:
+                lines.append(f"{name}={export_value(reg_type, data)}")
+
+        lines.append("")
+        return "\r\n".join(lines) + "\r\n"
+
+
+def _key_order(name: str):
+    '''
+    Get the sort key wineserver uses for key paths and value names.
+    '''
+    return [p.upper() for p in name.split("\\")]
+
+
+def _header_name(chunk: str):
+    '''
+    Get the unescaped key name and the end of the name in a section
+    (the text following the "[" of its header).
+    '''
+    end = chunk.find("]")
+    name = chunk[:end]
+    if "\\" in name.replace("\\\\", ""):
+        return parse_string(chunk, 0, "]")
+    return name.replace("\\\\", "\\"), end + 1
+
+
+def _update_section(chunk: str, changes: list, stamp: str, filetime: str):
+    '''
+    Apply value changes to a section of a hive file.
+
+    Parameters
+    ----------
+    chunk : str
+        the section, from the character after "[" to the blank line
+    changes : list
+        the (name, reg_type, data) changes, reg_type is None to delete
+    stamp : str
+        the new modification time for the header
+    filetime : str
+        the new modification time for the #time line
+
+    Return
+    ----------
+    str:
+        the updated section
+    '''
+    lines = chunk.split("\n")
+    end = _header_name(lines[0])[1]
+    head = [f"{lines[0][:end]} {stamp}"]
+    values = []
+    tail = []
+
+    for line in lines[1:]:
+        if not line:
+            tail.append(line)
+        elif line.startswith("  ") and values and values[-1][1].endswith("\\"):
+            values[-1][1] += "\n" + line
+        elif line.startswith("#time="):
+            head.append(f"#time={filetime}")
+        elif line.startswith("#"):
+            head.append(line)
+        else:
+            name = "" if line.startswith("@") else parse_string(line, 1, '"')[0]
+            values.append([name.upper(), line])
+
+    if not any(line.startswith("#time=") for line in head):
+        head.append(f"#time={filetime}")
+
+    for name, reg_type, data in changes:
+        values = [v for v in values if v[0] != name.upper()]
+        if reg_type is not None:
+            values.append([name.upper(), dump_value(name, reg_type, data)])
+
+    values.sort(key=lambda v: v[0])
+    tail = tail or [""]
+    return "\n".join(head + [v[1] for v in values] + tail)
+
+
+def write_hive(path: str, changes: list):
+    '''
+    Apply changes to a hive file in place, keeping the wineserver format.
+    The new content is written to a temporary file and renamed over the
+    hive, so readers never see a partial file.
+
+    Parameters
+    ----------
+    path : str
+        full path to the .reg file
+    changes : list
+        the (key, value, reg_type, data) changes, keys relative to the
+        hive root, reg_type is None to delete the value
+    '''
+    with open(path, "r", encoding="utf-8", errors="surrogateescape", newline="") as f:
+        chunks = f.read().split("\n[")
+
+    now = time.time()
+    stamp = str(int(now))
+    ticks = int((now + _filetime_epoch) * 10000000)
+    filetime = "%x%08x" % (ticks >> 32, ticks & 0xffffffff)
+
+    pending = {}
+    for key, value, reg_type, data in changes:
+        key = "\\".join(p for p in key.split("\\") if p)
+        pending.setdefault(key.upper(), (key, []))[1].append((value, reg_type, data))
+
+    names = [""] + [_header_name(c)[0] for c in chunks[1:]]
+
+    for i in range(1, len(chunks)):
+        name = names[i].upper()
+        if name in pending:
+            key_changes = pending.pop(name)[1]
+            chunks[i] = _update_section(chunks[i], key_changes, stamp, filetime)
+
+    for key, key_changes in pending.values():
+        if all(reg_type is None for _, reg_type, _ in key_changes):
+            continue
+
+        chunk = "%s] %s\n#time=%s\n" % (escape_string(key, "[]"), stamp, filetime)
+        chunk = _update_section(chunk, key_changes, stamp, filetime)
+
+        order = _key_order(key)
+        pos = len(chunks)
+        for i in range(1, len(chunks)):
+            if _key_order(names[i]) > order:
+                pos = i
+                break
+
+        if pos == len(chunks) and not chunks[-1].endswith("\n"):
+            chunks[-1] += "\n"
+        chunks.insert(pos, chunk)
+        names.insert(pos, key)
+
+    _replace_hive(path, "\n[".join(chunks))
+
+
+def _replace_hive(path: str, content: str):
+    '''
+    Atomically replace the content of a hive file, writing a temporary
+    file renamed over it.
+    '''
+    fd, tmp = tempfile.mkstemp(prefix=".reg", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", errors="surrogateescape", newline="") as f:
+            f.write(content)
+        os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def replace_path(path: str, old: str, new: str):
+    '''
+    Replace a Unix path in the string values of a hive file, both in its
+    Unix form and in its Z: drive form. Only whole path components are
+    replaced: the path must be followed by a separator, the end of the
+    string or the end of the value (/tmp/tpl doesn't match /tmp/tpl2).
+
+    Parameters
+    ----------
+    path : str
+        full path to the .reg file
+    old : str
+        the Unix path to be replaced
+    new : str
+        the new Unix path
+
+    Return
+    ----------
+    bool:
+        True if the hive contained the path and was rewritten
+    '''
+    with open(path, "r", encoding="utf-8", errors="surrogateescape", newline="") as f:
+        content = f.read()
+
+    forms = [
+        (escape_string(old, '""'), escape_string(new, '""')),
+        (escape_string("Z:" + old.replace("/", "\\"), '""'),
+         escape_string("Z:" + new.replace("/", "\\"), '""')),
+    ]
+
+    replaced = content
+    for old_form, new_form in forms:
+        replaced = re.sub(
+            re.escape(old_form) + r'(?=[/\\"]|\Z)',
+            lambda m: new_form,
+            replaced)
+
+    if replaced == content:
+        return False
+
+    _replace_hive(path, replaced)
+    return True
+
+
+def write_changes(wineprefix: str, changes):
+    '''
+    Apply changes straight to the wineprefix hive files. This must only
+    be done while no wineserver is holding the wineprefix.
+
+    Parameters
+    ----------
+    wineprefix : str
+        full path to the wineprefix
+    changes : iterable
+        the (key, value, reg_type, data) changes with full key names,
+        reg_type is None to delete the value (e.g. a RegistryBatch)
+
+    Return
+    ----------
+    bool:
+        True if the changes were written, False (and nothing is written)
+        if a key is not stored in the hives or a hive doesn't exist
+    '''
+    hives = {}
+
+    for key, value, reg_type, data in changes:
+        split = split_key(key)
+        if split is None:
+            return False
+
+        path = os.path.join(wineprefix, split[0])
+        if not os.path.isfile(path):
+            return False
+
+        hives.setdefault(path, []).append((split[1], value, reg_type, data))
+
+    for path, hive_changes in hives.items():
+        write_hive(path, hive_changes)
+
+    return True
@@ -0,0 +1,160 @@
+import os
+import threading
+
+from .utils.command import Command
+
+# essential paths of a Wine runner
+_promise = ("share", "bin", "lib")
+
+_loaders = ("wine64", "wine")
+
+_runners = {}
+_lock = threading.Lock()
+
+
+class Runner:
+    '''
+    Create a new object of type Runner with the metadata of a Wine
+    runner (a winepath). Use get() to share the object between all the
+    Wine objects using the same winepath.
+
+    Parameters
+    ----------
+    winepath : str
+        full path to Wine
+    fingerprint : tuple
+        the stat fingerprint of winepath, see _fingerprint
+    '''
+
+    winepath = str
+    fingerprint = tuple
+    valid = bool
+    arch = str
+    libs = list
+    tools = list
+
+    _version = None
+
+    def __init__(self, winepath: str, fingerprint: tuple):
+        self.winepath = winepath
+        self.fingerprint = fingerprint
+
+        try:
+            names = os.listdir(winepath)
+        except OSError:
+            names = []
+
+        self.valid = all(p in names for p in _promise)
+        self.libs = sorted(n for n in names if n in ("lib", "lib64"))
+
+        try:
+            self.tools = sorted(
+                e.name for e in os.scandir(f"{winepath}/bin")
+                if e.is_file() and os.access(e.path, os.X_OK))
+        except OSError:
+            self.tools = []
+
+        if "wine64" in self.tools and "wine" in self.tools:
+            self.arch = "win64+win32"
+        elif "wine64" in self.tools:
+            self.arch = "win64"
+        elif "wine" in self.tools:
+            self.arch = "win32"
+        else:
+            self.arch = None
+
+    def __repr__(self):
+        return f"<Runner {self.winepath} ({self.arch})>"
+
+    def has_tool(self, name: str):
+        '''
+        Check if an executable is in the bin directory of the runner.
+        '''
+        return name in self.tools
+
+    def version(self):
+        '''
+        Get the Wine version of the runner, probed running
+        wine --version the first time.
+
+        Return
+        ------
+        str:
+            the version (e.g. wine-6.0), None if it can't be probed.
+        '''
+        if self._version is not None:
+            return self._version
+
+        for loader in _loaders:
+            if loader in self.tools:
+                cmd = Command(argv=[f"{self.winepath}/bin/{loader}", "--version"])
+                try:
+                    lines = [line for line in cmd.stream() if line.strip()]
+                except Exception:
+                    lines = []
+                if cmd.returncode == 0 and lines:
+                    self._version = lines[0].strip()
+                    break
+
+        return self._version
+
+
+def _fingerprint(winepath: str):
+    '''
+    Get the stat fingerprint of a winepath, changing when entries are
+    added to or removed from it or its bin directory.
+
+    Return
+    ------
+    tuple:
+        the fingerprint, None if winepath doesn't exist.
+    '''
+    try:
+        root = os.stat(winepath)
+    except OSError:
+        return None
+
+    try:
+        bindir = os.stat(f"{winepath}/bin")
+        bindir = (bindir.st_ino, bindir.st_mtime_ns)
+    except OSError:
+        bindir = None
+
+    return (root.st_dev, root.st_ino, root.st_mtime_ns, bindir)
+
+
+def get(winepath: str):
+    '''
+    Get the Runner of a winepath. Runners are validated and probed once
+    per process and cached until the winepath fingerprint changes.
+
+    Parameters
+    ----------
+    winepath : str
+        full path to Wine
+
+    Return
+    ------
+    Runner:
+        the runner, check its valid attribute.
+    '''
+    fingerprint = _fingerprint(winepath)
+
+    runner = _runners.get(winepath)
+    if runner is not None and runner.fingerprint == fingerprint:
+        return runner
+
+    runner = Runner(winepath, fingerprint)
+    if fingerprint is not None:
+        with _lock:
+            _runners[winepath] = runner
+
+    return runner
+
+
+def clear():
+    '''
+    Forget all the cached runners.
+    '''
+    with _lock:
+        _runners.clear()
@@ -0,0 +1,332 @@
+import json
+import os
+import shutil
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import clone
+
+
+class SnapshotStore:
+    '''
+    Create a new object of type SnapshotStore, a content-addressed
+    store of wineprefix snapshots. Every snapshot is a manifest of the
+    wineprefix files (registry hives, drive_c, dosdevices) pointing to
+    objects named after their sha256; a file content is stored once,
+    whatever the number of snapshots holding it, and objects are
+    reflinked where the filesystem supports it.
+
+    Parameters
+    ----------
+    path : str
+        full path to the store directory (created if missing)
+    workers : int, optional
+        number of files hashed in parallel (default is 4)
+    '''
+
+    _path = str
+    _workers = int
+
+    def __init__(self, path: str, workers: int = 4):
+        self._path = os.path.abspath(path)
+        self._workers = workers
+
+    '''
+    Manifests
+    '''
+
+    def __manifest_path(self, snapshot_id: str):
+        if not snapshot_id or "/" in snapshot_id or snapshot_id.startswith("."):
+            raise ValueError(f"{snapshot_id} is not a valid snapshot id.")
+        return os.path.join(self._path, "manifests", f"{snapshot_id}.json")
+
+    def manifest(self, snapshot_id: str):
+        '''
+        Load the manifest of a snapshot.
+
+        Return
+        ----------
+        dict:
+            id, created, wineprefix, files (path: [digest, size,
+            mtime_ns, mode, inode]), symlinks (path: target) and dirs
+            (path: mode), paths relative to the wineprefix
+
+        Raises
+        ------
+        ValueError
+            If the snapshot doesn't exist.
+        '''
+        path = self.__manifest_path(snapshot_id)
+        if not os.path.isfile(path):
+            raise ValueError(f"The snapshot {snapshot_id} doesn't exist.")
+
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def file(self, snapshot_id: str, path: str):
+        '''
+        Get the stored object of a file of a snapshot, to be read only.
+
+        Parameters
+        ----------
+        snapshot_id : str
+            the snapshot id
+        path : str
+            the file path relative to the wineprefix (e.g. user.reg)
+
+        Return
+        ----------
+        str:
+            full path to the object, None if the snapshot doesn't have
+            the file
+        '''
+        entry = self.manifest(snapshot_id)["files"].get(os.path.normpath(path))
+        if entry is None:
+            return None
+        return self.__object_path(entry[0])
+
+    def snapshots(self, wineprefix: str = None):
+        '''
+        List the snapshots, oldest first.
+
+        Parameters
+        ----------
+        wineprefix : str, optional
+            only list the snapshots of this wineprefix
+
+        Return
+        ----------
+        list:
+            dicts with the id, created (unix time) and wineprefix
+        '''
+        manifests = os.path.join(self._path, "manifests")
+        if not os.path.isdir(manifests):
+            return []
+
+        snapshots = []
+        for name in os.listdir(manifests):
+            if not name.endswith(".json"):
+                continue
+            manifest = self.manifest(name[:-5])
+            if wineprefix is not None and manifest["wineprefix"] != os.path.abspath(wineprefix):
+                continue
+            snapshots.append({
+                "id": manifest["id"],
+                "created": manifest["created"],
+                "wineprefix": manifest["wineprefix"],
+            })
+
+        return sorted(snapshots, key=lambda s: (s["created"], s["id"]))
+
+    def delete(self, snapshot_id: str):
+        '''
+        Delete a snapshot and the objects no other snapshot uses.
+
+        Return
+        ----------
+        int:
+            the number of deleted objects
+        '''
+        os.remove(self.__manifest_path(snapshot_id))
+
+        used = set()
+        for snapshot in self.snapshots():
+            used.update(f[0] for f in self.manifest(snapshot["id"])["files"].values())
+
+        deleted = 0
+        objects = os.path.join(self._path, "objects")
+        for root, _, names in os.walk(objects):
+            for name in names:
+                if name not in used:
+                    os.remove(os.path.join(root, name))
+                    deleted += 1
+
+        return deleted
+
+    '''
+    Objects
+    '''
+
+    def __object_path(self, digest: str):
+        return os.path.join(self._path, "objects", digest[:2], digest)
+
+    def __store(self, path: str, digest: str):
+        '''
+        Store a file as an object, if not stored yet.
+        '''
+        target = self.__object_path(digest)
+        if os.path.exists(target):
+            return False
+
+        def create(tmp):
+            clone.clone_file(path, tmp)
+            os.chmod(tmp, 0o444)
+            return True
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return clone.replace_file(target, create)
+
+    '''
+    Scan
+    '''
+
+    def __scan(self, wineprefix: str):
+        '''
+        List the files, symlinks and directories of a wineprefix (the
+        store is skipped if it is inside the wineprefix).
+
+        Return
+        ----------
+        tuple:
+            files (path: stat), symlinks (path: target) and dirs
+            (path: mode)
+        '''
+        files, symlinks, dirs = {}, {}, {}
+
+        for root, subdirs, names in os.walk(wineprefix):
+            rel_root = os.path.relpath(root, wineprefix)
+
+            for name in list(subdirs):
+                path = os.path.join(root, name)
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                if path == self._path:
+                    subdirs.remove(name)
+                elif os.path.islink(path):
+                    symlinks[rel] = os.readlink(path)
+                    subdirs.remove(name)
+                else:
+                    dirs[rel] = stat.S_IMODE(os.lstat(path).st_mode)
+
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    symlinks[rel] = os.readlink(path)
+                elif stat.S_ISREG(st.st_mode):
+                    files[rel] = st
+
+        return files, symlinks, dirs
+
+    '''
+    Snapshot and restore
+    '''
+
+    def snapshot(self, wineprefix: str):
+        '''
+        Snapshot a wineprefix. The files unchanged (same size, mtime and
+        inode) since the last snapshot of the wineprefix are not hashed
+        again, only new contents are stored.
+
+        Return
+        ----------
+        str:
+            the snapshot id
+        '''
+        wineprefix = os.path.abspath(wineprefix)
+        files, symlinks, dirs = self.__scan(wineprefix)
+
+        previous = {}
+        snapshots = self.snapshots(wineprefix)
+        if snapshots:
+            previous = self.manifest(snapshots[-1]["id"])["files"]
+
+        entries = {}
+        to_hash = []
+        for rel, st in files.items():
+            old = previous.get(rel)
+            if old is not None and old[1:3] == [st.st_size, st.st_mtime_ns] and old[4] == st.st_ino \
+                    and os.path.exists(self.__object_path(old[0])):
+                entries[rel] = [old[0], st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode), st.st_ino]
+            else:
+                to_hash.append(rel)
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            paths = [os.path.join(wineprefix, rel) for rel in to_hash]
+            for rel, digest in zip(to_hash, executor.map(clone.hash_file, paths)):
+                st = files[rel]
+                self.__store(os.path.join(wineprefix, rel), digest)
+                entries[rel] = [digest, st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode), st.st_ino]
+
+        created = time.time()
+        snapshot_id = "%d-%s" % (created * 1000, os.urandom(3).hex())
+        manifest = {
+            "version": 1,
+            "id": snapshot_id,
+            "created": created,
+            "wineprefix": wineprefix,
+            "files": entries,
+            "symlinks": symlinks,
+            "dirs": dirs,
+        }
+
+        path = self.__manifest_path(snapshot_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+        return snapshot_id
+
+    def __restore_file(self, path: str, entry: list):
+        def create(tmp):
+            clone.clone_file(self.__object_path(entry[0]), tmp)
+            os.chmod(tmp, entry[3])
+            os.utime(tmp, ns=(entry[2], entry[2]))
+            return True
+
+        clone.replace_file(path, create)
+
+    def restore(self, wineprefix: str, snapshot_id: str):
+        '''
+        Restore a wineprefix to a snapshot. Only the files which differ
+        are touched: a file with the size and mtime of the snapshot is
+        kept, one with the same size but another mtime is hashed.
+
+        Return
+        ----------
+        dict:
+            how many files were restored, removed and kept
+        '''
+        wineprefix = os.path.abspath(wineprefix)
+        manifest = self.manifest(snapshot_id)
+        files, symlinks, dirs = self.__scan(wineprefix)
+        counts = {"restored": 0, "removed": 0, "kept": 0}
+
+        # remove what the snapshot doesn't have, deepest first
+        for rel in files:
+            if rel not in manifest["files"]:
+                os.remove(os.path.join(wineprefix, rel))
+                counts["removed"] += 1
+        for rel, target in symlinks.items():
+            if manifest["symlinks"].get(rel) != target:
+                os.remove(os.path.join(wineprefix, rel))
+        for rel in sorted(dirs, key=lambda d: -d.count(os.sep)):
+            if rel not in manifest["dirs"]:
+                shutil.rmtree(os.path.join(wineprefix, rel))
+
+        for rel in sorted(manifest["dirs"], key=lambda d: d.count(os.sep)):
+            path = os.path.join(wineprefix, rel)
+            if rel not in dirs:
+                os.makedirs(path, exist_ok=True)
+            os.chmod(path, manifest["dirs"][rel])
+
+        for rel, target in manifest["symlinks"].items():
+            if symlinks.get(rel) != target:
+                os.symlink(target, os.path.join(wineprefix, rel))
+
+        for rel, entry in manifest["files"].items():
+            st = files.get(rel)
+            if st is not None and st.st_size == entry[1]:
+                if st.st_mtime_ns == entry[2] or \
+                        clone.hash_file(os.path.join(wineprefix, rel)) == entry[0]:
+                    if stat.S_IMODE(st.st_mode) != entry[3]:
+                        os.chmod(os.path.join(wineprefix, rel), entry[3])
+                    counts["kept"] += 1
+                    continue
+
+            self.__restore_file(os.path.join(wineprefix, rel), entry)
+            counts["restored"] += 1
+
+        return counts
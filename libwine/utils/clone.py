@@ -0,0 +1,198 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+
+# ioctl request to share the extents of a file (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+_unsupported = (
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+)
+
+# devices where reflinks already failed
+_no_reflink = set()
+
+
+def reflink(src: str, dst: str):
+    '''
+    Create dst as a reflink (copy-on-write clone) of src.
+
+    Parameters
+    ----------
+    src : str
+        full path to the source file
+    dst : str
+        full path to the new file
+
+    Return
+    ----------
+    bool:
+        False if the filesystem doesn't support reflinks (dst is not
+        created)
+    '''
+    stat = os.stat(src)
+    if stat.st_dev in _no_reflink:
+        return False
+
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, stat.st_mode & 0o7777)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except OSError as e:
+            os.close(fd)
+            os.remove(dst)
+            if e.errno in _unsupported:
+                _no_reflink.add(stat.st_dev)
+                return False
+            raise
+        os.close(fd)
+
+    shutil.copystat(src, dst)
+    return True
+
+
+def clone_file(src: str, dst: str, hardlink: bool = False):
+    '''
+    Copy a file as cheaply as possible: a reflink if supported, then a
+    hard link if allowed, a full copy otherwise.
+
+    Parameters
+    ----------
+    src : str
+        full path to the source file
+    dst : str
+        full path to the new file
+    hardlink : bool, optional
+        if dst can share the inode with src (default False)
+
+    Return
+    ----------
+    str:
+        how the file was copied: reflink, hardlink or copy
+    '''
+    if reflink(src, dst):
+        return "reflink"
+
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024):
+    '''
+    Get the sha256 of a file content.
+
+    Parameters
+    ----------
+    path : str
+        full path to the file
+    chunk_size : int, optional
+        number of bytes read at once (default is 1 MiB)
+
+    Return
+    ----------
+    str:
+        the hex digest
+    '''
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def replace_file(path: str, create):
+    '''
+    Replace a file atomically: the new file is created next to it, as a
+    hidden .<name>.libwine file, then renamed over it. Readers see the
+    old content or the new one, never a partial file.
+
+    Parameters
+    ----------
+    path : str
+        full path to the file to be replaced (or created)
+    create : callable
+        called with the temporary path, creates the new file there;
+        nothing is replaced if it returns a false value
+
+    Return
+    ----------
+    object:
+        what create returned
+    '''
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.libwine")
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+
+    try:
+        result = create(tmp)
+        if result:
+            os.replace(tmp, path)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+    return result
+
+
+def clone_tree(src: str, dst: str, hardlink=None):
+    '''
+    Copy a directory tree using clone_file. Symlinks are recreated, the
+    absolute ones pointing inside src are moved to point inside dst.
+
+    Parameters
+    ----------
+    src : str
+        full path to the source directory
+    dst : str
+        full path to the new directory (created if missing)
+    hardlink : callable, optional
+        called with the path of each file relative to src, tells if the
+        file can be hard linked (default is never)
+
+    Return
+    ----------
+    dict:
+        how many files were reflinked, hard linked and copied
+    '''
+    src = os.path.abspath(src)
+    dst = os.path.abspath(dst)
+    counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+
+    os.makedirs(dst, exist_ok=True)
+    shutil.copystat(src, dst)
+
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target = os.path.normpath(os.path.join(dst, rel))
+
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            new = os.path.join(target, name)
+            rel_name = os.path.normpath(os.path.join(rel, name))
+
+            if os.path.islink(path):
+                link = os.readlink(path)
+                if link == src or link.startswith(src + os.sep):
+                    link = dst + link[len(src):]
+                os.symlink(link, new)
+            elif name in dirs:
+                os.mkdir(new)
+                shutil.copystat(path, new)
+            elif os.path.isfile(path):
+                can_link = hardlink is not None and hardlink(rel_name)
+                counts[clone_file(path, new, can_link)] += 1
+
+    return counts
@@ -1,5 +1,11 @@
+import asyncio
+import re
 import subprocess
 from os import path, mkdir, environ
+from time import perf_counter
+
+from .output import Output, Discard
+from .trace import CommandRecord
 
 
 class Command:
@@ -8,40 +14,118 @@ class Command:
 
     Parameters
     ----------
-    command : str
+    command : str, optional
         the command to be executed (use # for spaces to be kept)
     cwd: str, optional
         full path to the working directory
     envs: dict, optional
         dict of environment variables to pass on the execution
+    argv: list, optional
+        the command arguments, used as they are instead of command
+    close_fds: bool, optional
+        close the inherited file descriptors in the child (default True)
+    pre_hooks: list, optional
+        callables called with the Command before it is started
+    post_hooks: list, optional
+        callables called with a CommandRecord (argv, timings, exit code,
+        output size) when the command ends; execute_async without
+        comunicate calls them once the process is started
+    output: Output, optional
+        what to do with the output when it is not returned, see
+        libwine.utils.output (default is Discard)
 
     Raises
     ------
+    ValueError
+        If neither command nor argv are given.
     Exception
         If the command execution fail.
     '''
 
     _command = str
+    _args = None
     _cwd = "/tmp"
     _envs = {}
+    _close_fds = True
+    _line_limit = 65536
+    _stop_timeout = 5.0
+    _pre_hooks = []
+    _post_hooks = []
+    _setup = 0.0
+    _output = Discard()
+
+    _sbin = ("/usr/sbin", "/sbin")
+
+    returncode = None
+    record = None
+
+    # set by the caller, copied in the record
+    cold = None
+    operation = None
+
+    def __init__(self, command: str = None, cwd: str = None, envs: dict = None, argv: list = None,
+                 close_fds: bool = True, pre_hooks: list = None, post_hooks: list = None,
+                 output: Output = None):
+        started = perf_counter()
+
+        if command is None and argv is None:
+            raise ValueError("Either command or argv must be given.")
 
-    def __init__(self, command: str, cwd: str = None, envs: dict = None):
         self._command = command
-        self._envs = environ.copy()
-        self._envs["PATH"] = "/usr/sbin:/sbin:" + self._envs["PATH"]
+        self._args = argv
+        self._close_fds = close_fds
 
         if cwd is not None:
-            if not path.exists(cwd):
+            if path.exists(cwd):
+                self._cwd = cwd
+            else:
                 try:
                     mkdir(cwd)
                     self._cwd = cwd
                 except PermissionError:  # the /tmp path will be used
                     pass
 
-        if envs is not None:
-            self._envs = {**self._envs, **envs}
+        # the environment is only copied if it has to be changed
+        env_path = environ.get("PATH", "")
+        if envs or not all(p in env_path.split(":") for p in self._sbin):
+            self._envs = {
+                **environ,
+                "PATH": ":".join(self._sbin) + ":" + env_path,
+                **(envs or {})
+            }
+        else:
+            self._envs = None
+
+        if output is not None:
+            self._output = output
+        if pre_hooks:
+            self._pre_hooks = pre_hooks
+        if post_hooks:
+            self._post_hooks = post_hooks
+
+        self._setup = perf_counter() - started
+
+    def _argv(self):
+        '''
+        Get the command arguments, command is split on spaces
+        (# is kept as space).
+        '''
+        if self._args is not None:
+            return list(self._args)
+
+        return [c.replace('#', ' ') for c in self._command.split(" ")]
+
+    def _popen_args(self):
+        '''
+        Get the keyword arguments starting the process.
+        '''
+        return {
+            "cwd": self._cwd,
+            "env": self._envs,
+            "close_fds": self._close_fds,
+        }
 
-    def execute(self, comunicate: bool = False):
+    def execute(self, comunicate: bool = False, output: Output = None):
         '''
         Execute the command.
 
@@ -49,6 +133,9 @@ class Command:
         ----------
         comunicate : bool, optional
             to get the output of the command (default is False)
+        output : Output, optional
+            what to do with the output if comunicate is False (default
+            is the output given to the Command)
 
         Returns
         -------
@@ -64,30 +151,265 @@ class Command:
         Exception
             if command not found
         '''
-        command = self._command
-        command = command.split(" ")
-        command = [c.replace('#',' ') for c in command]
-        
+        if comunicate:
+            proc = self._spawn()
+            if proc is False:
+                return False
+
+            raw = proc.communicate()[0]
+            decode = perf_counter()
+            output = raw.decode("utf-8")
+            decode = perf_counter() - decode
+            self.__output_bytes = len(raw)
+            self.__finish(proc.returncode, decode)
+            return output
+
+        if output is None:
+            output = self._output
+
+        try:
+            proc = self._spawn(output.open())
+            if proc is False:
+                return False
+            self.__output_bytes = output.collect(proc)
+            self.__finish(proc.wait())
+        finally:
+            output.close()
+
+        return proc
+
+    def start(self, output: Output = None):
+        '''
+        Start the command without waiting for it. If the output policy
+        pipes the output, the caller has to read proc.stdout and pass the
+        chunks to output.write; call ended when the process exits.
+
+        Parameters
+        ----------
+        output : Output, optional
+            what to do with the output (default is the output given to
+            the Command)
+
+        Returns
+        -------
+        subprocess.Popen object
+            the subprocess object
+        bool
+            False if the command fail on execution
+
+        Raises
+        -------
+        Exception
+            if command not found
+        '''
+        if output is None:
+            output = self._output
+
+        try:
+            return self._spawn(output.open())
+        finally:
+            output.close()
+
+    def ended(self, returncode: int, output_bytes: int = 0):
+        '''
+        Complete the execution of a command started with start, calling
+        the post hooks.
+        '''
+        self.returncode = returncode
+        self.__output_bytes = output_bytes
+        self.__finish(returncode)
+
+    def _spawn(self, stdout=subprocess.PIPE):
+        '''
+        Start the command with the output (stdout and stderr) piped, or
+        sent to stdout (a subprocess.Popen stdout argument).
+
+        Returns
+        -------
+        subprocess.Popen object
+            the subprocess object
+        bool
+            False if the command fail on execution
+        '''
+        self.__begin()
         try:
             proc = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
+                self._argv(),
+                stdout=stdout,
                 stderr=subprocess.STDOUT,
-                cwd=self._cwd,
-                env=self._envs
+                **self._popen_args()
             )
         except FileNotFoundError:
             raise Exception("Command not found")
         except OSError:
             return False
-        print(proc.communicate()[0].decode("utf-8"))
-        if comunicate:
-            return proc.communicate()[0].decode("utf-8")
 
+        self.__spawned()
         return proc
 
+    def __begin(self):
+        '''
+        Call the pre hooks and start the record of the execution, only
+        if there are hooks.
+        '''
+        self.__output_bytes = 0
+        if not self._pre_hooks and not self._post_hooks:
+            return
+
+        for hook in self._pre_hooks:
+            hook(self)
+
+        self.record = CommandRecord(self._argv(), self._setup)
+        self.record.cold = self.cold
+        self.record.operation = self.operation
+        self.__started = perf_counter()
+
+    def __spawned(self):
+        if self.record is not None:
+            self.record.spawn = perf_counter() - self.__started
+
+    def __finish(self, returncode: int, decode: float = None):
+        '''
+        Complete the record of the execution and call the post hooks.
+        '''
+        record = self.record
+        if record is None:
+            return
+
+        elapsed = perf_counter() - self.__started
+        record.returncode = returncode
+        record.output_bytes = self.__output_bytes
+        record.decode = decode
+        record.run = elapsed - record.spawn - (decode or 0.0)
+        record.duration = record.setup + elapsed
+
+        for hook in self._post_hooks:
+            hook(record)
+
+    def __lines(self, proc: subprocess.Popen):
+        '''
+        Iterate over the decoded output lines of a process, a line longer
+        than _line_limit is split so that memory use stays bounded.
+        '''
+        readline = proc.stdout.readline
+        try:
+            for line in iter(lambda: readline(self._line_limit), b""):
+                self.__output_bytes += len(line)
+                yield line.decode("utf-8", "replace").rstrip("\r\n")
+        finally:
+            proc.stdout.close()
+
+    def stream(self, filters: list = None, callback=None):
+        '''
+        Execute the command and iterate over its output lines while they
+        are written, without holding the whole output in memory. If the
+        iteration is stopped early (break, close) the process is
+        terminated (SIGTERM, then SIGKILL after _stop_timeout seconds)
+        and waited for.
+
+        Parameters
+        ----------
+        filters : list, optional
+            regular expressions (str) or callables, only the lines matching
+            all of them are yielded
+        callback : callable, optional
+            a sink called with every yielded line
+
+        Yields
+        ------
+        str
+            the output lines, without line breaks
+
+        Raises
+        -------
+        Exception
+            if command not found
+        '''
+        filters = [
+            re.compile(f).search if isinstance(f, str) else f
+            for f in filters or []
+        ]
+
+        proc = self._spawn()
+        if proc is False:
+            return
+        self.returncode = None
+
+        lines = self.__lines(proc)
+        ended = False
+        try:
+            for line in lines:
+                if all(f(line) for f in filters):
+                    if callback is not None:
+                        callback(line)
+                    yield line
+            ended = True
+        finally:
+            lines.close()
+            if not ended and proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(self._stop_timeout)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+            self.returncode = proc.wait()
+            self.__finish(self.returncode)
+
     def comunicate(self):
         '''
         Execute the command and get the output
         '''
         return self.execute(comunicate=True)
+
+    async def execute_async(self, comunicate: bool = False):
+        '''
+        Execute the command without blocking the event loop.
+
+        Parameters
+        ----------
+        comunicate : bool, optional
+            to get the output of the command (default is False)
+
+        Returns
+        -------
+        asyncio.subprocess.Process object
+            the subprocess object, await its wait() for the exit code
+            (the output is discarded)
+        str
+            the command output if comunicate is set to True
+        bool
+            False if the command fail on execution
+
+        Raises
+        -------
+        Exception
+            if command not found
+        '''
+        output = asyncio.subprocess.PIPE if comunicate else asyncio.subprocess.DEVNULL
+
+        self.__begin()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *self._argv(),
+                stdout=output,
+                stderr=asyncio.subprocess.STDOUT,
+                **self._popen_args()
+            )
+        except FileNotFoundError:
+            raise Exception("Command not found")
+        except OSError:
+            return False
+        self.__spawned()
+
+        if comunicate:
+            raw = (await proc.communicate())[0]
+            decode = perf_counter()
+            output = raw.decode("utf-8")
+            decode = perf_counter() - decode
+            self.__output_bytes = len(raw)
+            self.__finish(proc.returncode, decode)
+            return output
+
+        self.__finish(None)
+        return proc
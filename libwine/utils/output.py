@@ -0,0 +1,184 @@
+import os
+import subprocess
+import threading
+
+
+class Output:
+    '''
+    Base class of the output policies, telling what to do with the
+    output (stdout and stderr) of a Command.
+    '''
+
+    def open(self):
+        '''
+        Get the stdout argument of subprocess.Popen.
+        '''
+        return subprocess.DEVNULL
+
+    def collect(self, proc: subprocess.Popen):
+        '''
+        Handle the output of a started process, called before waiting
+        for it.
+
+        Return
+        ----------
+        int:
+            the number of output bytes read
+        '''
+        return 0
+
+    def write(self, data: bytes, source=None):
+        '''
+        Handle a chunk of output read by someone else (e.g. the WineRun
+        reaper) from the pipe opened by a PIPE policy. The chunks of many
+        processes can be interleaved, source tells which one it comes
+        from (the reaper passes the process id).
+        '''
+
+    def end(self, source=None):
+        '''
+        Handle the end of the output of source, once everything was
+        passed to write.
+        '''
+
+    def close(self):
+        '''
+        Release what open acquired, called once the process ended (or
+        failed to start).
+        '''
+
+
+class Discard(Output):
+    '''
+    Create a new object of type Discard, the output is sent to
+    /dev/null (the default).
+    '''
+
+
+class Inherit(Output):
+    '''
+    Create a new object of type Inherit, the output is written straight
+    to the stdout of the Python process.
+    '''
+
+    def open(self):
+        return None
+
+
+class RingBuffer(Output):
+    '''
+    Create a new object of type RingBuffer keeping the last bytes of
+    the output, shared by all the commands using it.
+
+    Parameters
+    ----------
+    size : int, optional
+        how many bytes are kept (default is 64 KB)
+    '''
+
+    _size = int
+    _chunk_size = 65536
+
+    def __init__(self, size: int = 64 * 1024):
+        self._size = size
+        self.__buffer = bytearray()
+        self.__lock = threading.Lock()
+
+    def open(self):
+        return subprocess.PIPE
+
+    def collect(self, proc: subprocess.Popen):
+        read = 0
+        fd = proc.stdout.fileno()
+        try:
+            for chunk in iter(lambda: os.read(fd, self._chunk_size), b""):
+                read += len(chunk)
+                self.write(chunk)
+        finally:
+            proc.stdout.close()
+        return read
+
+    def write(self, data: bytes, source=None):
+        with self.__lock:
+            self.__buffer += data
+            if len(self.__buffer) > self._size:
+                del self.__buffer[:len(self.__buffer) - self._size]
+
+    def getvalue(self):
+        '''
+        Get the kept bytes.
+        '''
+        with self.__lock:
+            return bytes(self.__buffer)
+
+    def text(self):
+        '''
+        Get the kept output decoded, the first line can be partial.
+        '''
+        return self.getvalue().decode("utf-8", "replace")
+
+    def clear(self):
+        with self.__lock:
+            self.__buffer.clear()
+
+
+class LogFile(Output):
+    '''
+    Create a new object of type LogFile appending the output to a file,
+    which is written by the process itself (the output never goes
+    through Python). The file is rotated before starting a command when
+    it is larger than max_bytes, a single command output is not split.
+
+    Parameters
+    ----------
+    path : str
+        full path to the log file
+    max_bytes : int, optional
+        the size rotating the file (default is 10 MB, 0 to never rotate)
+    backups : int, optional
+        how many rotated files are kept as path.1, path.2, ...
+        (default is 3)
+    '''
+
+    _path = str
+    _max_bytes = int
+    _backups = int
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 3):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __rotate(self):
+        try:
+            size = os.path.getsize(self._path)
+        except OSError:
+            return
+
+        if not self._max_bytes or size < self._max_bytes:
+            return
+
+        if self._backups < 1:
+            os.remove(self._path)
+            return
+
+        for i in range(self._backups - 1, 0, -1):
+            src = f"{self._path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self._path}.{i + 1}")
+        os.replace(self._path, f"{self._path}.1")
+
+    def open(self):
+        with self.__lock:
+            self.__rotate()
+            fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.__local.fd = fd
+        return fd
+
+    def close(self):
+        fd = getattr(self.__local, "fd", None)
+        if fd is not None:
+            os.close(fd)
+            self.__local.fd = None
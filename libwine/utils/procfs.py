@@ -0,0 +1,328 @@
+import os
+import re
+import signal
+import time
+
+_proc = "/proc"
+
+_loaders = (
+    "wine",
+    "wine64",
+    "wine-preloader",
+    "wine64-preloader",
+)
+
+_servers = (
+    "wineserver",
+    "wineserver64",
+)
+
+# Wine rewrites the command line of a Windows process to its image path
+_image_re = re.compile(r"^[A-Za-z]:\\.*\.exe$", re.IGNORECASE)
+
+# zombie and dead processes
+dead_states = ("Z", "X", "x")
+
+clock_ticks = os.sysconf("SC_CLK_TCK")
+page_size = os.sysconf("SC_PAGE_SIZE")
+
+
+def available():
+    '''
+    Check if the processes can be listed using procfs.
+    '''
+    return os.path.isdir(f"{_proc}/self")
+
+
+def _read(pid: int, name: str):
+    '''
+    Read a file of a process, None if the process is gone or not
+    accessible.
+    '''
+    try:
+        with open(f"{_proc}/{pid}/{name}", "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_wineprefix(pid: int):
+    '''
+    Get the WINEPREFIX environment variable of a process.
+
+    Parameters
+    ----------
+    pid : int
+        the Unix process id
+
+    Return
+    ----------
+    str:
+        the wineprefix, None if not set or not readable
+    '''
+    environ = _read(pid, "environ")
+    if not environ:
+        return None
+
+    pos = environ.find(b"\0WINEPREFIX=")
+    if pos >= 0:
+        pos += 1
+    elif environ.startswith(b"WINEPREFIX="):
+        pos = 0
+    else:
+        return None
+
+    end = environ.find(b"\0", pos)
+    if end < 0:
+        end = len(environ)
+
+    return os.fsdecode(environ[pos + 11:end])
+
+
+def read_stat(pid: int):
+    '''
+    Get the fields of /proc/<pid>/stat following the command name.
+
+    Parameters
+    ----------
+    pid : int
+        the Unix process id
+
+    Return
+    ----------
+    list:
+        the fields as strings, starting from the state (field 3),
+        None if the process is gone
+    '''
+    stat = _read(pid, "stat")
+    if not stat:
+        return None
+
+    return parse_stat(stat)
+
+
+def read_statm(pid: int):
+    '''
+    Get the fields of /proc/<pid>/statm (sizes in pages).
+
+    Parameters
+    ----------
+    pid : int
+        the Unix process id
+
+    Return
+    ----------
+    list:
+        the fields as integers, None if the process is gone
+    '''
+    statm = _read(pid, "statm")
+    if not statm:
+        return None
+
+    return [int(f) for f in statm.split()]
+
+
+def parse_stat(stat: bytes):
+    '''
+    Split the content of /proc/<pid>/stat, skipping the pid and the
+    command name (which can contain spaces).
+
+    Return
+    ----------
+    list:
+        the fields as strings, starting from the state (field 3)
+    '''
+    return stat[stat.rfind(b")") + 2:].decode("ascii").split()
+
+
+def uptime():
+    '''
+    Get the system uptime in seconds.
+    '''
+    with open(f"{_proc}/uptime", "rb") as f:
+        return float(f.read().split()[0])
+
+
+def mem_total():
+    '''
+    Get the total system memory in bytes.
+    '''
+    with open(f"{_proc}/meminfo", "rb") as f:
+        for line in f:
+            if line.startswith(b"MemTotal:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def is_loader(pid: int):
+    '''
+    Check if the executable of a process is a Wine loader (wine, wine64
+    or their preloaders).
+    '''
+    try:
+        exe = os.readlink(f"{_proc}/{pid}/exe")
+    except OSError:
+        return False
+
+    if exe.endswith(" (deleted)"):
+        exe = exe[:-10]
+    return os.path.basename(exe) in _loaders
+
+
+def image_name(pid: int):
+    '''
+    Get the Windows image name of a Wine process from its command line.
+
+    Parameters
+    ----------
+    pid : int
+        the Unix process id
+
+    Return
+    ----------
+    str:
+        the image name (e.g. explorer.exe), None if the process is not
+        a Windows process (e.g. a shell which has WINEPREFIX set)
+    '''
+    cmdline = _read(pid, "cmdline")
+    if not cmdline:
+        return None
+
+    args = os.fsdecode(cmdline).split("\0")
+    if _image_re.match(args[0]):
+        return args[0].rsplit("\\", 1)[-1]
+
+    if not is_loader(pid):
+        return None
+
+    for arg in args:
+        name = arg.replace("\\", "/").rsplit("/", 1)[-1]
+        if name in _servers:
+            return None
+        if name and name not in _loaders:
+            return name
+
+    return None
+
+
+def scan(wineprefixes: list):
+    '''
+    List the Wine processes running in the given wineprefixes, reading
+    each process entry only once. Other processes having WINEPREFIX set
+    (shells, terminals, the caller itself) are not listed, see
+    image_name.
+
+    Parameters
+    ----------
+    wineprefixes : list
+        full paths to the wineprefixes
+
+    Return
+    ----------
+    dict:
+        for every wineprefix (as given), a list of dicts with the keys
+        pid, name, ppid and threads
+    '''
+    prefixes = {}
+    for wineprefix in wineprefixes:
+        prefixes.setdefault(os.path.realpath(wineprefix), []).append(wineprefix)
+
+    found = {wineprefix: [] for wineprefix in wineprefixes}
+    resolved = {}
+
+    for entry in os.listdir(_proc):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+
+        wineprefix = read_wineprefix(pid)
+        if wineprefix is None:
+            continue
+        if wineprefix not in resolved:
+            resolved[wineprefix] = os.path.realpath(wineprefix)
+        wineprefix = resolved[wineprefix]
+        if wineprefix not in prefixes:
+            continue
+
+        name = image_name(pid)
+        stat = read_stat(pid)
+        if name is None or stat is None:
+            continue
+
+        process = {
+            "pid": pid,
+            "name": name,
+            "ppid": int(stat[1]),
+            "threads": int(stat[17]),
+        }
+        for key in prefixes[wineprefix]:
+            found[key].append(process)
+
+    return found
+
+
+def ancestors(pid: int):
+    '''
+    Get a process and all its ancestors.
+
+    Return
+    ----------
+    set:
+        the pids, from pid up to init
+    '''
+    found = set()
+    while pid > 0 and pid not in found:
+        found.add(pid)
+        stat = read_stat(pid)
+        if stat is None:
+            break
+        pid = int(stat[1])
+
+    return found
+
+
+def running(pid: int):
+    '''
+    Check if a process is running (zombies are not).
+    '''
+    stat = read_stat(pid)
+    return stat is not None and stat[0] not in dead_states
+
+
+def terminate(pids: list, timeout: float = 5.0):
+    '''
+    Terminate processes sending SIGTERM, then SIGKILL to the ones still
+    running after the grace period.
+
+    Parameters
+    ----------
+    pids : list
+        the Unix process ids
+    timeout : float, optional
+        the grace period in seconds (default is 5)
+
+    Return
+    ----------
+    list:
+        the pids which had to be killed with SIGKILL
+    '''
+    alive = []
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+            alive.append(pid)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + timeout
+    while alive and time.monotonic() < deadline:
+        time.sleep(0.05)
+        alive = [pid for pid in alive if running(pid)]
+
+    for pid in alive:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    return alive
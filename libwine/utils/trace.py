@@ -0,0 +1,214 @@
+import functools
+import inspect
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# the operation the commands started by the current thread are made for
+_current = threading.local()
+
+
+class CommandRecord:
+    '''
+    Create a new object of type CommandRecord with the timings of a
+    command execution, passed to the Command post hooks.
+
+    Parameters
+    ----------
+    argv : list
+        the command arguments
+    setup : float
+        seconds spent building the command (environment included)
+    '''
+
+    argv = list
+    setup = float
+    spawn = None
+    run = None
+    decode = None
+    duration = None
+    returncode = None
+    output_bytes = 0
+    cold = None
+    operation = None
+
+    def __init__(self, argv: list, setup: float):
+        self.argv = argv
+        self.setup = setup
+
+    def __repr__(self):
+        return f"<CommandRecord {self.label()} {self.duration}s>"
+
+    def label(self):
+        '''
+        Get the operation, or the program and its first argument
+        (e.g. wine64 winecfg) if it is not set.
+        '''
+        if self.operation is not None:
+            return self.operation
+        return " ".join([os.path.basename(self.argv[0])] + self.argv[1:2])
+
+    def as_dict(self):
+        '''
+        Get the record as a dict.
+
+        Return
+        ----------
+        dict:
+            argv, operation, cold, returncode, output_bytes and the
+            timings in seconds: setup, spawn, run, decode (None if the
+            output is decoded while read) and duration (the total)
+        '''
+        return {
+            "argv": self.argv,
+            "operation": self.operation,
+            "cold": self.cold,
+            "returncode": self.returncode,
+            "output_bytes": self.output_bytes,
+            "setup": self.setup,
+            "spawn": self.spawn,
+            "run": self.run,
+            "decode": self.decode,
+            "duration": self.duration,
+        }
+
+
+@contextmanager
+def operation(name: str):
+    '''
+    Tag the commands started inside the context, in the same thread,
+    with an operation name (see CommandRecord). When operations are
+    nested the outermost one is kept, e.g. set_windows using reg_add.
+    '''
+    if getattr(_current, "name", None) is not None:
+        yield
+        return
+
+    _current.name = name
+    try:
+        yield
+    finally:
+        _current.name = None
+
+
+def current_operation():
+    '''
+    Get the name of the operation running in the current thread, None
+    if there is none.
+    '''
+    return getattr(_current, "name", None)
+
+
+def traced(method):
+    '''
+    Decorate a method so that the commands it starts are tagged with
+    its name, see operation. A generator method is tagged each time it
+    is resumed, not while the caller handles what it yielded (the caller
+    can run other operations in between, or stop iterating).
+    '''
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator(*args, **kwargs):
+            steps = method(*args, **kwargs)
+            try:
+                while True:
+                    with operation(method.__name__):
+                        try:
+                            item = next(steps)
+                        except StopIteration:
+                            return
+                    yield item
+            finally:
+                steps.close()
+
+        return generator
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with operation(method.__name__):
+            return method(*args, **kwargs)
+
+    return wrapper
+
+
+class CommandStats:
+    '''
+    Create a new object of type CommandStats aggregating CommandRecord
+    objects, use its add method as a Command post hook.
+
+    Parameters
+    ----------
+    records : int, optional
+        how many of the last records are kept (default is 100)
+    '''
+
+    calls = int
+    failures = int
+    cold = int
+    output_bytes = int
+    duration = float
+    operations = dict
+    records = deque
+
+    def __init__(self, records: int = 100):
+        self.__lock = threading.Lock()
+        self.records = deque(maxlen=records)
+        self.reset()
+
+    def reset(self):
+        '''
+        Forget the collected records.
+        '''
+        with self.__lock:
+            self.calls = 0
+            self.failures = 0
+            self.cold = 0
+            self.output_bytes = 0
+            self.duration = 0.0
+            self.operations = {}
+            self.records.clear()
+
+    def add(self, record: CommandRecord):
+        '''
+        Add a record to the stats.
+        '''
+        duration = record.duration or 0.0
+        operation = record.label()
+
+        with self.__lock:
+            self.calls += 1
+            self.failures += record.returncode not in (0, None)
+            self.cold += bool(record.cold)
+            self.output_bytes += record.output_bytes
+            self.duration += duration
+            self.records.append(record)
+
+            stats = self.operations.setdefault(
+                operation, {"calls": 0, "duration": 0.0, "max": 0.0})
+            stats["calls"] += 1
+            stats["duration"] += duration
+            stats["max"] = max(stats["max"], duration)
+
+    def summary(self):
+        '''
+        Get the aggregated stats.
+
+        Return
+        ----------
+        dict:
+            calls, failures, cold (calls starting a wineserver),
+            output_bytes, duration and the calls, duration and max
+            duration by operation, slowest first
+        '''
+        with self.__lock:
+            operations = sorted(
+                self.operations.items(), key=lambda o: -o[1]["duration"])
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "cold": self.cold,
+                "output_bytes": self.output_bytes,
+                "duration": self.duration,
+                "operations": {name: dict(s) for name, s in operations},
+            }
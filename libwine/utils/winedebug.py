@@ -0,0 +1,300 @@
+import re
+import subprocess
+import threading
+
+from .output import Output
+
+# [timestamp:][pid:]tid:class:channel:function message, the pid is only
+# logged with +pid
+_line_re = re.compile(
+    r"^(?:(?P<time>\d+\.\d+):)?(?P<first>[0-9a-f]{4,8}):(?:(?P<second>[0-9a-f]{4,8}):)?"
+    r"(?P<cls>fixme|err|warn|trace):(?P<channel>[\w-]+):(?P<function>\S*) ?(?P<message>.*)$"
+)
+
+debug_classes = ("err", "warn", "fixme", "trace")
+
+
+class WineDebugLine:
+    '''
+    Create a new object of type WineDebugLine, a parsed WINEDEBUG line.
+
+    Parameters
+    ----------
+    pid : str
+        the Windows process id (hex), None if not logged (only with
+        WINEDEBUG=+pid)
+    tid : str
+        the Windows thread id (hex)
+    cls : str
+        the debug class: err, warn, fixme or trace
+    channel : str
+        the debug channel (e.g. ntdll)
+    function : str
+        the function logging the line
+    message : str
+        the message
+    time : float, optional
+        the timestamp (with WINEDEBUG=+timestamp)
+    '''
+
+    def __init__(self, pid: str, tid: str, cls: str, channel: str, function: str, message: str,
+                 time: float = None):
+        self.pid = pid
+        self.tid = tid
+        self.cls = cls
+        self.channel = channel
+        self.function = function
+        self.message = message
+        self.time = time
+
+    def __repr__(self):
+        return f"<WineDebugLine {self.cls}:{self.channel}:{self.function}>"
+
+    def __str__(self):
+        ids = self.tid if self.pid is None else f"{self.pid}:{self.tid}"
+        return f"{ids}:{self.cls}:{self.channel}:{self.function} {self.message}"
+
+
+def parse_line(line: str):
+    '''
+    Parse a WINEDEBUG line.
+
+    Return
+    ----------
+    WineDebugLine:
+        the parsed line, None if it is not a WINEDEBUG line (e.g. the
+        output of the program)
+    '''
+    match = _line_re.match(line)
+    if match is None:
+        return None
+
+    time = match.group("time")
+    pid, tid = match.group("first", "second")
+    if tid is None:
+        pid, tid = None, pid
+
+    return WineDebugLine(
+        pid=pid,
+        tid=tid,
+        cls=match.group("cls"),
+        channel=match.group("channel"),
+        function=match.group("function"),
+        message=match.group("message"),
+        time=float(time) if time is not None else None
+    )
+
+
+class LogPipeline(Output):
+    '''
+    Create a new object of type LogPipeline filtering the WINEDEBUG
+    output of the commands. Every line is counted by channel and class,
+    then dropped unless it matches the filters and the sampling. Kept
+    lines are passed to sink.
+
+    It can be used as an output policy (see Wine.set_output), as a
+    filter of Wine.execute(stream=True) or fed with lines directly.
+
+    Parameters
+    ----------
+    channels : list, optional
+        the channels to keep (default is all)
+    exclude : list, optional
+        the channels to drop
+    classes : list, optional
+        the classes to keep (default is all): err, warn, fixme, trace
+    sample : dict, optional
+        channels mapped to N, only one line every N is kept (e.g.
+        {"relay": 100}); "*" applies to every channel
+    sink : callable, optional
+        called with each kept WineDebugLine (or str for the lines which
+        are not WINEDEBUG lines)
+    other : bool, optional
+        keep the lines which are not WINEDEBUG lines (default True)
+
+    The counters are shared by all the commands using the pipeline.
+    '''
+
+    _channels = None
+    _exclude = frozenset()
+    _classes = None
+    _sample = dict
+    _sink = None
+    _other = True
+    _line_limit = 65536
+
+    def __init__(self, channels: list = None, exclude: list = None, classes: list = None,
+                 sample: dict = None, sink=None, other: bool = True):
+        if classes is not None:
+            invalid = set(classes) - set(debug_classes)
+            if invalid:
+                raise ValueError(f"{', '.join(sorted(invalid))} are not valid debug classes.")
+            self._classes = frozenset(classes)
+
+        if channels is not None:
+            self._channels = frozenset(channels)
+        if exclude is not None:
+            self._exclude = frozenset(exclude)
+
+        self._sample = dict(sample or {})
+        self._sink = sink
+        self._other = other
+        self.__lock = threading.Lock()
+        # the partial last line written by each source, see write
+        self.__partials = {}
+        self.reset()
+
+    def reset(self):
+        '''
+        Forget the counters.
+        '''
+        self.counts = {}
+        self.kept = 0
+        self.dropped = 0
+        self.others = 0
+
+    def winedebug(self):
+        '''
+        Get a WINEDEBUG value enabling only the kept classes and channels,
+        so that Wine doesn't even write the others (see Wine.set_winedebug).
+
+        Return
+        ----------
+        str:
+            the WINEDEBUG value
+        '''
+        enabled = sorted(self._classes or debug_classes)
+        if self._channels is None:
+            spec = ["-all"] + [f"{c}+all" for c in enabled]
+        else:
+            spec = ["-all"] + [f"{c}+{ch}" for ch in sorted(self._channels) for c in enabled]
+        spec += [f"-{ch}" for ch in sorted(self._exclude)]
+        return ",".join(spec)
+
+    def feed(self, line: str):
+        '''
+        Count and filter a line.
+
+        Return
+        ----------
+        WineDebugLine or str:
+            the kept line (parsed if it is a WINEDEBUG line), None if it
+            is dropped
+        '''
+        parsed = parse_line(line)
+
+        with self.__lock:
+            if parsed is None:
+                if not self._other:
+                    self.dropped += 1
+                    return None
+                self.others += 1
+                kept = line
+            else:
+                channel = parsed.channel
+                stats = self.counts.get(channel)
+                if stats is None:
+                    stats = self.counts[channel] = dict.fromkeys(debug_classes, 0)
+                stats[parsed.cls] += 1
+
+                if not self.__keep(parsed, stats):
+                    self.dropped += 1
+                    return None
+                kept = parsed
+
+            self.kept += 1
+
+        if self._sink is not None:
+            self._sink(kept)
+        return kept
+
+    def __keep(self, parsed: WineDebugLine, stats: dict):
+        channel = parsed.channel
+        if self._classes is not None and parsed.cls not in self._classes:
+            return False
+        if channel in self._exclude:
+            return False
+        if self._channels is not None and channel not in self._channels:
+            return False
+
+        every = self._sample.get(channel, self._sample.get("*"))
+        if every and every > 1:
+            # the first line of the channel is always kept
+            return (sum(stats.values()) - 1) % every == 0
+
+        return True
+
+    def __call__(self, line: str):
+        '''
+        Filter for Command.stream, see feed.
+        '''
+        return self.feed(line) is not None
+
+    def process(self, lines):
+        '''
+        Iterate over the kept lines of an iterable of lines.
+        '''
+        for line in lines:
+            kept = self.feed(line)
+            if kept is not None:
+                yield kept
+
+    def summary(self):
+        '''
+        Get the counters.
+
+        Return
+        ----------
+        dict:
+            kept, dropped and other lines, and the number of lines by
+            channel and class (dropped ones included), busiest first
+        '''
+        with self.__lock:
+            channels = sorted(self.counts.items(), key=lambda c: -sum(c[1].values()))
+            return {
+                "kept": self.kept,
+                "dropped": self.dropped,
+                "others": self.others,
+                "channels": {name: dict(c) for name, c in channels},
+            }
+
+    '''
+    Output policy
+    '''
+
+    def open(self):
+        return subprocess.PIPE
+
+    def collect(self, proc: subprocess.Popen):
+        read = 0
+        readline = proc.stdout.readline
+        try:
+            for line in iter(lambda: readline(self._line_limit), b""):
+                read += len(line)
+                self.feed(line.decode("utf-8", "replace").rstrip("\r\n"))
+        finally:
+            proc.stdout.close()
+        return read
+
+    def write(self, data: bytes, source=None):
+        with self.__lock:
+            lines = (self.__partials.pop(source, b"") + data).split(b"\n")
+            partial = lines.pop()
+            if len(partial) > self._line_limit:
+                lines.append(partial)
+            elif partial:
+                self.__partials[source] = partial
+
+        for line in lines:
+            self.feed(line.decode("utf-8", "replace").rstrip("\r"))
+
+    def end(self, source=None):
+        with self.__lock:
+            partial = self.__partials.pop(source, b"")
+
+        if partial:
+            self.feed(partial.decode("utf-8", "replace").rstrip("\r"))
+
+    def close(self):
+        # the last line of the output written without a source
+        self.end()
@@ -1,8 +1,18 @@
-import glob
+import fcntl
+import fnmatch
+import os
 import re
+import tempfile
+from contextlib import contextmanager
 
 from .utils.command import Command
+from .utils.output import Discard, Output
+from .utils import clone, procfs
+from .utils.trace import CommandStats, current_operation, operation, traced
+from . import regdiff, registry, runner
+from .snapshot import SnapshotStore
 from .wineprocess import WineProcess
+from .winerun import WineRun
 
 
 class Wine:
@@ -31,6 +41,15 @@ class Wine:
     _winepath = str
     _wineprefix = str
     _verbose = int
+    _hives = registry.HiveCache
+    _runner = runner.Runner
+    _batch = None
+    _session = False
+    _pre_hooks = []
+    _post_hooks = []
+    _stats = None
+    _output = None
+    _winedebug = None
 
     _terminals = {
         'xterm': 'xterm -e %s',
@@ -98,6 +117,13 @@ class Wine:
         },
     }
 
+    _template_mutable = [
+        "*.reg",
+        "*.ini",
+        "*.log",
+        "drive_c/windows/temp/*",
+    ]
+
     _dll_overrides = {
         0: "builtin",
         1: "native",
@@ -105,7 +131,11 @@ class Wine:
         3: "native,builtin"
     }
 
-    _reg_types = {
+    # value name, type and data of a `reg query` line
+    _reg_query_re = re.compile(r"^    (.*?)    (REG_[A-Z_]+)(?:    (.*))?$")
+
+    # the data_type ids of reg_add
+    _data_types = {
         0: "REG_SZ",
         1: "REG_DWORD",
         2: "REG_MULTI_SZ",
@@ -117,6 +147,7 @@ class Wine:
     def __init__(self, winepath: str, wineprefix: str, verbose: int = 0):
         self._winepath = winepath
         self._wineprefix = wineprefix
+        self._hives = registry.HiveCache(wineprefix)
 
         if verbose in self._verbose_levels:
             self._verbose = verbose
@@ -130,18 +161,52 @@ class Wine:
 
     def __validate_winepath(self):
         '''
-        Check if essential paths exist in winepath.
+        Check if essential paths exist in winepath. The runner is
+        validated once per process, see runner.get.
         '''
-        promise = ["share", "bin", "lib"]
+        self._runner = runner.get(self._winepath)
+        return self._runner.valid
 
-        dirs = glob.glob(f"{self._winepath}/*")
-        dirs = [d.replace(f"{self._winepath}/", "") for d in dirs]
+    def runner(self):
+        '''
+        Get the metadata of the Wine runner (version, arch, tools).
 
-        for p in promise:
-            if p not in dirs:
-                return False
+        Return
+        ------
+        Runner:
+            the runner of winepath.
+        '''
+        return self._runner
+
+    def wineserver_running(self):
+        '''
+        Check if a wineserver is holding the wineprefix. The wineserver
+        keeps the registry in memory and flushes it to the hive files
+        lazily, so these can only be trusted when no server is running.
+        '''
+        try:
+            stat = os.stat(self._wineprefix)
+        except FileNotFoundError:
+            return False
+
+        lock = "/tmp/.wine-%d/server-%x-%x/lock" % (
+            os.getuid(), stat.st_dev, stat.st_ino)
 
-        return True
+        try:
+            fd = os.open(lock, os.O_RDWR)
+        except OSError:
+            return False
+
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        else:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+        return False
 
     def check_arch_compatibility(self):
         '''
@@ -150,13 +215,15 @@ class Wine:
         '''
         return
 
-    def execute(self, command: str, comunicate: bool = False, envs: dict = {}, terminal: str = None, cwd: str = None):
+    def execute(self, command: str = None, comunicate: bool = False, envs: dict = {}, terminal: str = None,
+                cwd: str = None, stream: bool = False, filters: list = None, callback=None, argv: list = None,
+                output: Output = None):
         '''
         Execute command inside wineprefix using the wine in winepath
 
         Parameters
         ----------
-        command : str
+        command : str, optional
             command to be executed inside the wineprefix
         comunicate : bool, optional
             to get the output of the command (default is False)
@@ -166,27 +233,135 @@ class Wine:
             command to an external terminal (default is None)
         cwd: str, optional
             full path to the working directory
+        stream: bool, optional
+            to get a generator over the output lines while they are
+            written (default is False), see Command.stream
+        filters: list, optional
+            only with stream, regular expressions or callables the
+            lines must match
+        callback: callable, optional
+            only with stream, called with every output line
+        argv: list, optional
+            the command arguments, used instead of command so that they
+            can contain spaces (e.g. ["regedit", "/S", "C:\\my file.reg"])
+        output: Output, optional
+            what to do with the output if comunicate and stream are False
+            (default is the one set with set_output, see
+            libwine.utils.output)
+        '''
+        cmd = self._command(command, envs, terminal, cwd, argv)
+
+        if stream:
+            return cmd.stream(filters=filters, callback=callback)
+
+        if comunicate:
+            return cmd.comunicate()
+
+        return cmd.execute(output=output)
+
+    def _command(self, command: str, envs: dict, terminal: str = None, cwd: str = None, argv: list = None):
+        '''
+        Build the Command running a command inside the wineprefix,
+        see execute.
         '''
-        envs["WINEPREFIX"] = self._wineprefix
-        envs["WINEDEBUG"] = self._verbose_levels[self._verbose]
-        command = f"{self._winepath}/bin/wine64 {command}"
+        envs = {
+            **envs,
+            "WINEPREFIX": self._wineprefix,
+            "WINEDEBUG": self._winedebug or self._verbose_levels[self._verbose]
+        }
 
-        if terminal in self._terminals:
-            command = self._terminals[terminal] % command
-        
         if cwd is None:
-            cwd=self._wineprefix
+            cwd = self._wineprefix
+
+        if argv is None:
+            command = f"{self._winepath}/bin/wine64 {command}"
+            if terminal in self._terminals:
+                command = self._terminals[terminal] % command
+        else:
+            argv = [f"{self._winepath}/bin/wine64", *argv]
+            if terminal in self._terminals:
+                template = self._terminals[terminal].split(" ")
+                i = template.index("%s")
+                argv = template[:i] + argv + template[i + 1:]
 
-        cmd = Command(
+        return self._traced(Command(
             command=command,
+            argv=argv,
             cwd=cwd,
-            envs=envs
-        )
+            envs=envs,
+            pre_hooks=self._pre_hooks,
+            post_hooks=self._post_hooks,
+            output=self._output
+        ))
 
-        if comunicate:
-            return cmd.comunicate()
+    def _traced(self, cmd: Command):
+        '''
+        Tag a Command with the Wine method it is executed for (the
+        outermost method decorated with traced, see
+        libwine.utils.trace.operation) and if the wineserver has to be
+        started, only if there are hooks.
+        '''
+        if not self._pre_hooks and not self._post_hooks:
+            return cmd
 
-        return cmd.execute()
+        cmd.cold = not self.wineserver_running()
+        cmd.operation = current_operation()
+        return cmd
+
+    '''
+    Instrumentation
+    '''
+
+    def add_hooks(self, pre=None, post=None):
+        '''
+        Add hooks to the commands executed for the wineprefix,
+        see Command.
+
+        Parameters
+        ----------
+        pre : callable, optional
+            called with each Command before it is started
+        post : callable, optional
+            called with a CommandRecord when each command ends, the
+            record operation is the Wine method which executed it
+            (e.g. set_windows) and cold tells if the wineserver wasn't
+            running yet
+        '''
+        if pre is not None:
+            self._pre_hooks = self._pre_hooks + [pre]
+        if post is not None:
+            self._post_hooks = self._post_hooks + [post]
+
+    def enable_stats(self, records: int = 100):
+        '''
+        Start collecting the timings of the commands executed for the
+        wineprefix.
+
+        Parameters
+        ----------
+        records : int, optional
+            how many of the last CommandRecord are kept (default is 100)
+
+        Return
+        ------
+        CommandStats:
+            the stats, see stats.
+        '''
+        if self._stats is None:
+            self._stats = CommandStats(records)
+            self.add_hooks(post=self._stats.add)
+        return self._stats
+
+    def stats(self):
+        '''
+        Get the timings of the commands executed for the wineprefix.
+
+        Return
+        ------
+        CommandStats:
+            the stats, None if enable_stats wasn't called.
+        '''
+        return self._stats
 
     '''
     Setters
@@ -197,16 +372,45 @@ class Wine:
             raise ValueError(f"{level} is not a valid verbose level.")
         self._verbose = self._verbose_levels[level]
 
+    def set_winedebug(self, spec: str = None):
+        '''
+        Set the WINEDEBUG value of the executed commands, overriding the
+        verbose level (e.g. "-all,err+all,+seh", see
+        LogPipeline.winedebug).
+
+        Parameters
+        ----------
+        spec : str, optional
+            the WINEDEBUG value, None to use the verbose level again
+        '''
+        self._winedebug = spec
+
+    def set_output(self, output: Output):
+        '''
+        Set what to do with the output of the executed commands when it
+        is not returned (discarded by default).
+
+        Parameters
+        ----------
+        output : Output
+            the output policy, one of libwine.utils.output: Discard,
+            Inherit (printed on stdout), RingBuffer (the last bytes are
+            kept) or LogFile (written to a rotated file)
+        '''
+        self._output = output
+
     '''
     Wine Tools
     '''
 
+    @traced
     def winecfg(self):
         '''
         Launch the winecfg tool on the active display.
         '''
         self.execute(command="winecfg")
 
+    @traced
     def debug(self, terminal: str = None, wineconsole: bool = False):
         '''
         Launch the winedbg tool.
@@ -225,6 +429,7 @@ class Wine:
                 terminal=terminal
             )
 
+    @traced
     def cmd(self, terminal: str = None, wineconsole: bool = False):
         '''
         Launch the cmd tool.
@@ -243,27 +448,31 @@ class Wine:
                 terminal=terminal
             )
 
+    @traced
     def taskmanager(self):
         '''
         Launch the taskmgr tool on the active display.
         '''
         self.execute(command="taskmgr")
 
+    @traced
     def controlpanel(self):
         '''
         Launch the control tool on the active display.
         '''
         self.execute(command="control")
 
+    @traced
     def uninstaller(self, uuid: str = None):
         '''
         Launch the uninstaller tool on the active display.
         '''
-        command = "uninstaller"
+        argv = ["uninstaller"]
         if uuid is not None:
-            command = f"uninstaller --remove '{uuid}'"
-        self.execute(command)
+            argv += ["--remove", uuid]
+        self.execute(argv=argv)
 
+    @traced
     def regedit(self):
         '''
         Launch the regedit tool on the active display.
@@ -274,6 +483,7 @@ class Wine:
     Wine command execution
     '''
 
+    @traced
     def command(self, command: str):
         '''
         Execute custom wine commands inside the wineprefix.
@@ -285,44 +495,98 @@ class Wine:
         '''
         self.execute(command=command)
 
+    @traced
     def run_exe(self, executable_path: str, envs: dict = {}, cwd: str = None):
         '''
-        Execute exe files inside the wineprefix.
+        Execute exe files inside the wineprefix, without waiting for them.
         executable_path : str
             full path to the .exe file
         envs: dict, optional
             dict of environment variables to pass on the execution
         cwd: str, optional
             full path to the working directory
+
+        Return
+        ------
+        WineRun:
+            the handle of the running program, None if it can't be
+            started.
         '''
-        command = executable_path
-        self.execute(command=command, envs=envs, cwd=cwd)
+        name = executable_path.replace("\\", "/").rsplit("/", 1)[-1]
+        return self.start([executable_path], name, envs, cwd)
 
+    @traced
     def run_msi(self, msi_path: str, envs: dict = {}, cwd: str = None):
         '''
-        Execute msi files inside the wineprefix.
+        Execute msi files inside the wineprefix, without waiting for them.
         msi_path : str
             full path to the .msi file
         envs: dict, optional
             dict of environment variables to pass on the execution
         cwd: str, optional
             full path to the working directory
+
+        Return
+        ------
+        WineRun:
+            the handle of the running installer, None if it can't be
+            started.
         '''
-        command = f"msiexec /i {msi_path}"
-        self.execute(command=command, envs=envs, cwd=cwd)
+        return self.start(["msiexec", "/i", msi_path], "msiexec.exe", envs, cwd)
 
+    @traced
     def run_bat(self, bat_path: str, envs: dict = {}, cwd: str = None):
         '''
-        Execute bat files inside the wineprefix.
+        Execute bat files inside the wineprefix, without waiting for them.
         bat_path : str
             full path to the .bat file
         envs: dict, optional
             dict of environment variables to pass on the execution
         cwd: str, optional
             full path to the working directory
+
+        Return
+        ------
+        WineRun:
+            the handle of the running script, None if it can't be
+            started.
+        '''
+        return self.start(["wineconsole", "cmd", "/c", bat_path], "wineconsole.exe", envs, cwd)
+
+    @traced
+    def start(self, argv: list, name: str = None, envs: dict = {}, cwd: str = None, output: Output = None):
+        '''
+        Start a command inside the wineprefix without waiting for it.
+
+        Parameters
+        ----------
+        argv : list
+            the command arguments
+        name : str, optional
+            the program name (default is the first argument)
+        envs: dict, optional
+            dict of environment variables to pass on the execution
+        cwd: str, optional
+            full path to the working directory
+        output: Output, optional
+            what to do with the output (default is the one set with
+            set_output)
+
+        Return
+        ------
+        WineRun:
+            the handle of the running program, None if it can't be
+            started.
         '''
-        command = f"wineconsole cmd /c '{bat_path}'"
-        self.execute(command=command, envs=envs, cwd=cwd)
+        cmd = self._command(None, envs, None, cwd, argv)
+        if output is None:
+            output = cmd._output
+
+        proc = cmd.start(output)
+        if proc is False:
+            return None
+
+        return WineRun(proc, cmd, name or argv[0], self, output)
 
     '''
     Wine uptime management
@@ -330,7 +594,14 @@ class Wine:
 
     def __wineboot(self, status: int, silent: bool = True):
         '''
-        Manage Wine server uptime using wineboot
+        Manage Wine server uptime using wineboot, see _wineboot_command.
+        '''
+        argv, envs = self._wineboot_command(status, silent)
+        self.execute(argv=argv, envs=envs)
+
+    def _wineboot_command(self, status: int, silent: bool = True):
+        '''
+        Get the wineboot command managing Wine server uptime
 
         Parameters
         ----------
@@ -343,6 +614,11 @@ class Wine:
         silent: bool, optional
             if the command should not display on display (default True)
 
+        Return
+        ------
+        tuple:
+            the command arguments and the environment variables
+
         Raises
         ------
         Exception
@@ -361,16 +637,236 @@ class Wine:
 
         if status in states:
             status = states[status]
-            self.execute(command=f"wineboot {status}", envs=envs)
+            return ["wineboot", status], envs
         else:
             raise ValueError(f"[{status}] is not a valid status for wineboot!")
 
+    def __wineserver(self, *args):
+        '''
+        Run the wineserver of winepath for the wineprefix. The output is
+        discarded whatever the output policy: wineserver -p daemonizes
+        and keeps its output open, a piped policy would wait for it to
+        exit.
+
+        Parameters
+        ----------
+        args : str
+            the wineserver arguments
+        '''
+        cmd = self._traced(Command(
+            argv=[f"{self._winepath}/bin/wineserver", *args],
+            cwd=self._wineprefix,
+            envs={"WINEPREFIX": self._wineprefix},
+            pre_hooks=self._pre_hooks,
+            post_hooks=self._post_hooks,
+            output=Discard()
+        ))
+        cmd.execute()
+
+    @traced
+    def wineserver_wait(self):
+        '''
+        Wait for the wineserver of the wineprefix to exit (wineserver -w),
+        without stopping it. The server exits on its own a few seconds
+        after the last program of the wineprefix, the hive files are then
+        up to date (e.g. to take a snapshot after an installer).
+
+        Return
+        ------
+        bool:
+            True if no wineserver is running anymore.
+        '''
+        if self.wineserver_running():
+            self.__wineserver("-w")
+        return not self.wineserver_running()
+
+    @contextmanager
+    def session(self):
+        '''
+        Keep a persistent wineserver (wineserver -p) running for the
+        wineprefix, so that the commands executed inside the context don't
+        pay for the server startup. On exit the server is stopped
+        (wineserver -k, killing the processes still running) and waited
+        for (wineserver -w). If a wineserver was already running, it is
+        used and left running.
+
+        Note that a running server holds the registry: inside the session
+        every registry read or change (reg_*, set_*, override_dll*) runs
+        its own wine process instead of using the hive files, which is
+        slower than outside of it. Make the registry changes before the
+        session, or group them in a registry_batch (a single regedit
+        import).
+        '''
+        if self._session or self.wineserver_running():
+            yield self
+            return
+
+        with operation("session"):
+            self.__wineserver("-p")
+        self._session = True
+        try:
+            yield self
+        finally:
+            self._session = False
+            with operation("session"):
+                self.__wineserver("-k")
+                self.__wineserver("-w")
+
+    def create_from_template(self, template_prefix: str, hardlink: bool = False):
+        '''
+        Create the wineprefix as a copy of an already initialised one,
+        instead of running wineboot. Files are reflinked where the
+        filesystem supports it and copied otherwise. Symlinks and registry
+        values pointing inside the template are moved to the new
+        wineprefix.
+
+        Parameters
+        ----------
+        template_prefix : str
+            full path to the template wineprefix (no wineserver must be
+            running for it)
+        hardlink : bool, optional
+            where reflinks are not supported, hard link the files under
+            drive_c/windows instead of copying them, except the mutable
+            ones (_template_mutable). The linked files are the same inode
+            in the template and in every wineprefix created from it: a
+            program writing one in place (an installer patching a dll)
+            changes all of them. Only use it for templates and wineprefixes
+            which never modify the Windows files (default False)
+
+        Return
+        ------
+        dict:
+            how many files were reflinked, hard linked and copied.
+
+        Raises
+        ------
+        ValueError
+            If the template is not a wineprefix or the wineprefix
+            already exists and is not empty.
+        '''
+        if not os.path.isfile(f"{template_prefix}/system.reg"):
+            raise ValueError("Given template doesn't seem a valid wineprefix.")
+
+        if os.path.isdir(self._wineprefix) and os.listdir(self._wineprefix):
+            raise ValueError("The wineprefix already exists.")
+
+        def can_link(path):
+            if not hardlink or not path.startswith("drive_c/windows/"):
+                return False
+            return not any(fnmatch.fnmatch(path, m) for m in self._template_mutable)
+
+        counts = clone.clone_tree(template_prefix, self._wineprefix, can_link)
+
+        for hive in ("system.reg", "user.reg", "userdef.reg"):
+            path = f"{self._wineprefix}/{hive}"
+            if os.path.isfile(path):
+                registry.replace_path(
+                    path,
+                    os.path.abspath(template_prefix),
+                    os.path.abspath(self._wineprefix))
+
+        return counts
+
+    '''
+    Wineprefix snapshots
+    '''
+
+    def _snapshot_store(self, store: str = None):
+        '''
+        Get the SnapshotStore, by default in the .snapshots directory of
+        the wineprefix.
+        '''
+        if store is None:
+            store = os.path.join(self._wineprefix, ".snapshots")
+        return SnapshotStore(store)
+
+    def snapshot(self, store: str = None):
+        '''
+        Snapshot the wineprefix (registry hives, drive_c and dosdevices).
+        Only the file contents not in the store yet are copied, reflinked
+        where the filesystem supports it.
+
+        Parameters
+        ----------
+        store : str, optional
+            full path to the snapshot store, it can be shared by many
+            wineprefixes (default is the .snapshots directory of the
+            wineprefix)
+
+        Return
+        ------
+        str:
+            the snapshot id.
+
+        Raises
+        ------
+        ValueError
+            If a wineserver is running for the wineprefix (it keeps
+            running a few seconds after the last program exited, see
+            wineserver_wait).
+        '''
+        if self.wineserver_running():
+            raise ValueError("The wineprefix is in use by a running wineserver.")
+
+        return self._snapshot_store(store).snapshot(self._wineprefix)
+
+    def restore(self, snapshot_id: str, store: str = None):
+        '''
+        Restore the wineprefix to a snapshot, touching only the files
+        which differ from it.
+
+        Parameters
+        ----------
+        snapshot_id : str
+            the snapshot id, see snapshot
+        store : str, optional
+            full path to the snapshot store (default is the .snapshots
+            directory of the wineprefix)
+
+        Return
+        ------
+        dict:
+            how many files were restored, removed and kept.
+
+        Raises
+        ------
+        ValueError
+            If a wineserver is running for the wineprefix (see
+            wineserver_wait) or the snapshot doesn't exist.
+        '''
+        if self.wineserver_running():
+            raise ValueError("The wineprefix is in use by a running wineserver.")
+
+        counts = self._snapshot_store(store).restore(self._wineprefix, snapshot_id)
+        self._hives.clear()
+        return counts
+
+    def snapshots(self, store: str = None):
+        '''
+        List the snapshots of the wineprefix, oldest first.
+
+        Parameters
+        ----------
+        store : str, optional
+            full path to the snapshot store (default is the .snapshots
+            directory of the wineprefix)
+
+        Return
+        ------
+        list:
+            dicts with the id and the creation time of the snapshots.
+        '''
+        return self._snapshot_store(store).snapshots(self._wineprefix)
+
+    @traced
     def kill(self):
         '''
         Kill all processes running inside the wineprefix.
         '''
         self.__wineboot(status=0)
 
+    @traced
     def restart(self):
         '''
         Simulate system restart for the wineprefix,
@@ -378,12 +874,14 @@ class Wine:
         '''
         self.__wineboot(status=1)
 
+    @traced
     def shutdown(self):
         '''
         Simulate system shutdown for the wineprefix, don't reboot.
         '''
         self.__wineboot(status=2)
 
+    @traced
     def update(self):
         '''
         Update the wineprefix directory.
@@ -394,21 +892,50 @@ class Wine:
     Wine process management
     '''
 
+    @traced
     def processes(self):
         '''
-        Get processes running on the wineprefix.
+        Get processes running on the wineprefix. Processes are found
+        scanning /proc when available, using winedbg otherwise.
 
         Return
         ------
         list:
             A list of WineProcess.
         '''
+        if procfs.available():
+            return self._procfs_processes()
+
+        winedbg = self.execute(
+            argv=["winedbg", "--command", "info proc"],
+            comunicate=True)
+
+        return self._parse_winedbg(winedbg)
+
+    def _procfs_processes(self):
+        '''
+        Get processes running on the wineprefix scanning /proc.
+        '''
+        return [
+            WineProcess(
+                pid=None,
+                name=p["name"],
+                wine=self,
+                unix_pid=p["pid"],
+                unix_ppid=p["ppid"],
+                threads=p["threads"]
+            )
+            for p in procfs.scan([self._wineprefix])[self._wineprefix]
+        ]
+
+    def _parse_winedbg(self, output: str):
+        '''
+        Get processes from the winedbg "info proc" output.
+        '''
         processes = []
         parent = None
 
-        winedbg = self.execute(
-            command='winedbg --command "info proc"',
-            comunicate=True).split("\n")
+        winedbg = output.split("\n")
 
         # remove the first line from the output (the header)
         del winedbg[0]
@@ -443,10 +970,54 @@ class Wine:
 
         return processes
 
+    @traced
+    def kill_processes(self, predicate=None, timeout: float = 5.0):
+        '''
+        Kill many processes running on the wineprefix at once, protected
+        processes are skipped, as are the calling process and its
+        ancestors. SIGTERM is sent to all of them, then SIGKILL to the
+        ones still running after the grace period.
+
+        Parameters
+        ----------
+        predicate : callable, optional
+            called with each WineProcess, only processes for which it
+            returns True are killed (default is all)
+        timeout : float, optional
+            the grace period in seconds (default is 5)
+
+        Return
+        ------
+        list:
+            The killed WineProcess.
+
+        Raises
+        ------
+        ValueError
+            If the processes can't be listed from /proc, their Unix pids
+            are needed to kill them.
+        '''
+        if not procfs.available():
+            raise ValueError("Killing processes requires /proc.")
+
+        caller = procfs.ancestors(os.getpid())
+        processes = [
+            p for p in self.processes()
+            if not p.is_protected() and p.unix_pid not in caller
+            and (predicate is None or predicate(p))
+        ]
+
+        pids = [p.unix_pid for p in processes]
+        if pids:
+            procfs.terminate(pids, timeout)
+
+        return processes
+
     '''
     Wine register management
     '''
 
+    @traced
     def reg_list(self, key: str):
         '''
         List all keys values from the wineprefix register.
@@ -459,22 +1030,143 @@ class Wine:
         Return
         ------
         list:
-            A list of key values.
+            A list of RegValue (name, reg_type and decoded data).
         '''
-        values = []
-        command = f'reg query "{key}" /f'
+        values = self._reg_list_offline(key)
+        if values is not None:
+            return values
+
         output = self.execute(
-            command=command,
-            comunicate=True).split("\n")
+            argv=["reg", "query", key, "/f"],
+            comunicate=True)
 
-        for o in output:
-            if o.startswith("    "):
-                o = re.sub(' +', '|', o[4:].replace("\r", ""))
-                values.append(o.split("|"))
+        return self._parse_reg_query(output)
+
+    def _reg_list_offline(self, key: str):
+        '''
+        List the key values from the hive files, None if no wineserver
+        is holding the wineprefix or the hive doesn't exist.
+        '''
+        if self.wineserver_running():
+            return None
+
+        return self._hives.read_key(key)
+
+    def _parse_reg_query(self, output: str):
+        '''
+        Get key values from the `reg query` output.
+        '''
+        values = []
+
+        for o in output.split("\n"):
+            match = self._reg_query_re.match(o.rstrip("\r"))
+            if match is not None:
+                name, type_name, text = match.groups()
+                values.append(registry.query_value(name, type_name, text or ""))
 
         return values
 
-    def reg_add(self, key: str, value: str, data: str, data_type: int = 0):
+    @traced
+    def reg_walk(self, key: str, depth: int = None):
+        '''
+        Walk a key and all its subkeys. The keys are read from the hive
+        files, or from a single `regedit /E` export if a wineserver is
+        holding the wineprefix; one key at a time is kept in memory.
+
+        Parameters
+        ----------
+        key : str
+            the full key name (e.g. HKEY_CURRENT_USER\\Software)
+        depth : int, optional
+            how many levels of subkeys are walked (default is all, 0 only
+            walks the key itself)
+
+        Return
+        ------
+        generator:
+            (key, values) tuples, the full key name and the values as a
+            list of RegValue.
+        '''
+        if not self.wineserver_running():
+            walk = self._hives.walk(key, depth)
+            if walk is not None:
+                yield from walk
+                return
+
+        yield from self.__reg_walk_export(key, depth)
+
+    def __reg_walk_export(self, key: str, depth: int = None):
+        '''
+        Walk a key and its subkeys from a `regedit /E` export.
+        '''
+        root = key.replace("/", "\\").strip("\\")
+        fd, path, win_path = self.__reg_tempfile()
+        os.close(fd)
+
+        try:
+            self.execute(argv=["regedit", "/E", win_path, root], comunicate=True)
+
+            with open(path, "r", encoding="utf-16", errors="surrogatepass") as f:
+                exported = None
+                for name, values in registry.parse_export(f):
+                    # the export uses the long root names (e.g. HKEY_CURRENT_USER)
+                    if exported is None:
+                        exported = len(name)
+                    rel = name[exported:].lstrip("\\")
+
+                    if depth is not None and rel and rel.count("\\") + 1 > depth:
+                        continue
+                    yield "\\".join(p for p in (root, rel) if p), values
+        finally:
+            os.remove(path)
+
+    def reg_diff(self, wineprefix: str = None, snapshot_id: str = None, store: str = None):
+        '''
+        Compare the registry of the wineprefix with a reference one, read
+        from the hive files of another wineprefix or of a snapshot.
+
+        Parameters
+        ----------
+        wineprefix : str, optional
+            full path to the reference wineprefix (e.g. a known-good one)
+        snapshot_id : str, optional
+            the reference snapshot id, see snapshot
+        store : str, optional
+            full path to the snapshot store (default is the .snapshots
+            directory of the wineprefix)
+
+        Return
+        ------
+        generator:
+            RegistryChange objects, from the reference to the wineprefix.
+
+        Raises
+        ------
+        ValueError
+            If a wineserver is running for the wineprefix (its changes
+            may not be saved to the hive files yet), no reference or both
+            are given.
+        '''
+        if (wineprefix is None) == (snapshot_id is None):
+            raise ValueError("Give either a wineprefix or a snapshot_id to compare with.")
+
+        if self.wineserver_running():
+            raise ValueError("The wineprefix is in use by a running wineserver.")
+
+        if wineprefix is not None:
+            old = regdiff.wineprefix_hives(wineprefix)
+        else:
+            snapshots = self._snapshot_store(store)
+            old = {}
+            for name in regdiff.wineprefix_hives(""):
+                path = snapshots.file(snapshot_id, name)
+                if path is not None:
+                    old[name] = path
+
+        return regdiff.diff_registries(old, regdiff.wineprefix_hives(self._wineprefix))
+
+    @traced
+    def reg_add(self, key: str, value: str, data, data_type=0):
         '''
         Add (or edit) key to the wineprefix register.
 
@@ -484,26 +1176,46 @@ class Wine:
             the key name
         value : str
             the key value
-        data : str
-            the data to store in the key value
-        data_type : int
-            the type of data (default 0:REG_SZ):
+        data : str, int, bytes, list or RegValue
+            the data to store in the key value, as for `reg add` or
+            decoded (see RegValue); the type of a RegValue (e.g. read
+            with reg_list) is used instead of data_type
+        data_type : int or str
+            the type of data, an id or a type name such as REG_QWORD
+            (default 0:REG_SZ):
             0 (REG_SZ): standard string
             1 (REG_DWORD): data by a four byte number
             2 (REG_MULTI_SZ): multiple string
             3 (REG_BINARY): data as raw binary data
             4 (REG_EXPAND_SZ): expandable data string
             5 (REG_NONE): no defined value type
+
+        Note that the ids are not the Windows type numbers stored in
+        RegValue.reg_type, pass the RegValue or its type_name.
         '''
+        if isinstance(data, registry.RegValue):
+            data, data_type = data.data, data.type_name
+        elif not isinstance(data_type, str):
+            if data_type not in self._data_types:
+                raise ValueError("Given key type is not supported.")
+            data_type = self._data_types[data_type]
 
-        if data_type not in self._reg_types:
-            raise ValueError("Given key type is not supported.")
+        if self._batch is not None:
+            # keys use # for spaces on the command line
+            self._batch.add(key.replace("#", " "), value, data, data_type)
+            return
 
-        data_type = self._reg_types.get(data_type)
+        batch = registry.RegistryBatch()
+        batch.add(key.replace("#", " "), value, data, data_type)
+        if self.__reg_write(batch):
+            return
 
-        command = f'reg add {key} /v {value} /d {data} /t {data_type} /f'
-        self.execute(command=command)
+        _, data_type, data = registry.format_value(value, *registry.coerce_data(data_type, data))
+        self.execute(argv=[
+            "reg", "add", key.replace("#", " "), "/v", value,
+            "/d", data, "/t", data_type, "/f"])
 
+    @traced
     def reg_delete(self, key: str, value: str):
         '''
         Delete key from the wineprefix register.
@@ -515,13 +1227,110 @@ class Wine:
         value : str
             the key value to be removed
         '''
-        command = f'reg delete "{key}" /v "{value}" /f'
-        self.execute(command=command)
+        if self._batch is not None:
+            self._batch.delete(key.replace("#", " "), value)
+            return
+
+        batch = registry.RegistryBatch()
+        batch.delete(key.replace("#", " "), value)
+        if self.__reg_write(batch):
+            return
+
+        self.execute(argv=[
+            "reg", "delete", key.replace("#", " "), "/v", value, "/f"])
+
+    @contextmanager
+    def registry_batch(self):
+        '''
+        Collect the registry changes made inside the context (reg_add,
+        reg_delete and the helpers using them) and apply them with a
+        single regedit import on exit. Nested batches are merged into
+        the outermost one, nothing is applied if the context raises.
+
+        Return
+        ------
+        RegistryBatch:
+            the batch collecting the changes.
+        '''
+        if self._batch is not None:
+            yield self._batch
+            return
+
+        self._batch = registry.RegistryBatch()
+        try:
+            yield self._batch
+            batch = self._batch
+        finally:
+            self._batch = None
+
+        with operation("registry_batch"):
+            self.__reg_import(batch)
+
+    def __reg_import(self, batch: registry.RegistryBatch):
+        '''
+        Apply a registry batch, straight to the hive files if possible,
+        using regedit otherwise.
+
+        Parameters
+        ----------
+        batch : RegistryBatch
+            the changes to be applied
+        '''
+        if not batch or self.__reg_write(batch):
+            return
+
+        fd, path, win_path = self.__reg_tempfile()
+        try:
+            with os.fdopen(fd, "w", encoding="utf-16-le") as f:
+                f.write("\ufeff" + batch.export())
+            self.execute(argv=["regedit", "/S", win_path], comunicate=True)
+        finally:
+            os.remove(path)
+
+    def __reg_tempfile(self):
+        '''
+        Create a temporary .reg file visible from the wineprefix.
+
+        Return
+        ------
+        tuple:
+            the file descriptor, the unix path and the Windows path.
+        '''
+        tmp = f"{self._wineprefix}/drive_c/windows/temp"
+        if os.path.isdir(tmp):
+            fd, path = tempfile.mkstemp(prefix="libwine-", suffix=".reg", dir=tmp)
+            win_path = f"C:\\windows\\temp\\{os.path.basename(path)}"
+        else:
+            fd, path = tempfile.mkstemp(prefix="libwine-", suffix=".reg")
+            win_path = "Z:" + path.replace("/", "\\")
+
+        return fd, path, win_path
+
+    def __reg_write(self, batch: registry.RegistryBatch):
+        '''
+        Write a registry batch straight to the hive files, only if no
+        wineserver is holding the wineprefix.
+
+        Parameters
+        ----------
+        batch : RegistryBatch
+            the changes to be applied
+
+        Return
+        ------
+        bool:
+            True if the changes were written.
+        '''
+        if self.wineserver_running():
+            return False
+
+        return registry.write_changes(self._wineprefix, batch)
 
     '''
     Simplified Wine register keys
     '''
 
+    @traced
     def set_windows(self, version: str):
         '''
         Change Windows version of the wineprefix.
@@ -547,36 +1356,38 @@ class Wine:
         if version not in self._windows_versions:
             raise ValueError("Given version is not supported.")
 
-        self.reg_add(
-            key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
-            value="ProductName",
-            data=self._windows_versions.get(version)["ProductName"]
-        )
+        with self.registry_batch():
+            self.reg_add(
+                key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
+                value="ProductName",
+                data=self._windows_versions.get(version)["ProductName"]
+            )
 
-        self.reg_add(
-            key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
-            value="CSDVersion",
-            data=self._windows_versions.get(version)["CSDVersion"]
-        )
+            self.reg_add(
+                key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
+                value="CSDVersion",
+                data=self._windows_versions.get(version)["CSDVersion"]
+            )
 
-        self.reg_add(
-            key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
-            value="CurrentBuild",
-            data=self._windows_versions.get(version)["CurrentBuild"]
-        )
+            self.reg_add(
+                key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
+                value="CurrentBuild",
+                data=self._windows_versions.get(version)["CurrentBuild"]
+            )
 
-        self.reg_add(
-            key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
-            value="CurrentBuildNumber",
-            data=self._windows_versions.get(version)["CurrentBuildNumber"]
-        )
+            self.reg_add(
+                key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
+                value="CurrentBuildNumber",
+                data=self._windows_versions.get(version)["CurrentBuildNumber"]
+            )
 
-        self.reg_add(
-            key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
-            value="CurrentVersion",
-            data=self._windows_versions.get(version)["CurrentVersion"]
-        )
+            self.reg_add(
+                key="HKEY_LOCAL_MACHINE\\Software\\Microsoft\\Windows NT\\CurrentVersion",
+                value="CurrentVersion",
+                data=self._windows_versions.get(version)["CurrentVersion"]
+            )
 
+    @traced
     def set_app_default(self, executable: str, version: str):
         '''
         Change default Windows version per application
@@ -610,6 +1421,7 @@ class Wine:
             data=version
         )
 
+    @traced
     def set_virtual_desktop(self, status: bool, res: str = None):
         '''
         Enable or disable the Wine Virtual Desktop.
@@ -621,23 +1433,25 @@ class Wine:
         res : str (optional)
             the resolution to be used (e.g. 800x600) only if status is True
         '''
-        if status:
-            self.reg_add(
-                key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer",
-                value="Desktop",
-                data="Default"
-            )
-            self.reg_add(
-                key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer\\Desktops",
-                value="Default",
-                data=res
-            )
-        else:
-            self.reg_delete(
-                key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer",
-                value="Desktop"
-            )
+        with self.registry_batch():
+            if status:
+                self.reg_add(
+                    key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer",
+                    value="Desktop",
+                    data="Default"
+                )
+                self.reg_add(
+                    key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer\\Desktops",
+                    value="Default",
+                    data=res
+                )
+            else:
+                self.reg_delete(
+                    key="HKEY_CURRENT_USER\\Software\\Wine\\Explorer",
+                    value="Desktop"
+                )
 
+    @traced
     def set_decorations(self, status: bool):
         '''
         Enable or disable the windows manager decorations.
@@ -658,6 +1472,7 @@ class Wine:
             data=status
         )
 
+    @traced
     def set_window_managed(self, status: bool):
         '''
         Enable or disable the windows manager control.
@@ -678,6 +1493,7 @@ class Wine:
             data=status
         )
 
+    @traced
     def set_fullscreen_mouse_capture(self, status: bool):
         '''
         Enable or disable auto mouse capture in fullscreen.
@@ -698,6 +1514,7 @@ class Wine:
             data=status
         )
 
+    @traced
     def set_dpi(self, dpi: int):
         '''
         Set custom DPI value.
@@ -708,7 +1525,7 @@ class Wine:
             the new density value
         '''
         self.reg_add(
-            key="HKEY_CURRENT_USER\\Control#Panel\\Desktop",
+            key="HKEY_CURRENT_USER\\Control Panel\\Desktop",
             value="LogPixels",
             data=dpi,
             data_type=1
@@ -718,34 +1535,68 @@ class Wine:
     Wine DLL overrides management
     '''
 
-    def override_dll_list(self):
+    def __dll_overrides_key(self, executable: str = None):
+        '''
+        Get the key of the DLL overrides, of the wineprefix or of an
+        application.
+        '''
+        if executable is None:
+            return "HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides"
+        return f"HKEY_CURRENT_USER\\Software\\Wine\\AppDefaults\\{executable}\\DllOverrides"
+
+    @traced
+    def override_dll_list(self, executable: str = None):
         '''
         List all DLL overrides in the wineprefix
 
+        Parameters
+        ----------
+        executable : str, optional
+            list the overrides of an application (e.g. game.exe) instead
+            of the wineprefix ones
+
         Return
         ------
         list:
             A list of dll overrides.
         '''
         overrides = []
-        values = self.reg_list(
-            "HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides")
+        modes = {v: k for k, v in self._dll_overrides.items()}
+        values = self.reg_list(self.__dll_overrides_key(executable))
         for v in values:
-            override = [v[0]]
-            if v[2] == "native,builtin":
-                override.append(3)
-            elif v[2] == "builtin,native":
-                override.append(2)
-            elif v[2] == "native":
-                override.append(1)
-            elif v[2] == "builtin":
-                override.append(0)
+            override = [v.name]
+            if v.data in modes:
+                override.append(modes[v.data])
 
             overrides.append(override)
 
         return overrides
 
-    def override_dll(self, name: str, override: int = 0, restore: bool = False):
+    @traced
+    def override_dll_map(self, executable: str = None):
+        '''
+        Get all DLL overrides in the wineprefix, read once (from the hive
+        file if no wineserver is running).
+
+        Parameters
+        ----------
+        executable : str, optional
+            get the overrides of an application (e.g. game.exe) instead
+            of the wineprefix ones
+
+        Return
+        ------
+        dict:
+            the DLL names mapped to the type of override (see
+            override_dll), or to the raw value if it is not one of them
+            (e.g. "" for a disabled DLL).
+        '''
+        modes = {v: k for k, v in self._dll_overrides.items()}
+        values = self.reg_list(self.__dll_overrides_key(executable))
+        return {v.name: modes.get(v.data, v.data) for v in values}
+
+    @traced
+    def override_dll(self, name: str, override: int = 0, restore: bool = False, executable: str = None):
         '''
         Overriding a DLL in the wineprefix.
 
@@ -761,6 +1612,8 @@ class Wine:
             3 (native/builtin): native then builtin
         restore : bool (optional)
             restore the override to the initiale state (default False)
+        executable : str, optional
+            override the DLL only for an application (e.g. game.exe)
         '''
 
         if override not in self._dll_overrides:
@@ -768,12 +1621,44 @@ class Wine:
 
         if not restore:
             self.reg_add(
-                key="HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides",
+                key=self.__dll_overrides_key(executable),
                 value=name,
                 data=self._dll_overrides.get(override)
             )
         else:
             self.reg_delete(
-                key="HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides",
+                key=self.__dll_overrides_key(executable),
                 value=name
             )
+
+    @traced
+    def override_dlls(self, overrides: dict = None, restore: list = None, executable: str = None):
+        '''
+        Override and restore many DLLs at once (e.g. a DXVK set), with a
+        single registry transaction, see registry_batch.
+
+        Parameters
+        ----------
+        overrides : dict, optional
+            the DLL names mapped to the type of override, see override_dll
+        restore : list, optional
+            the DLL names to be restored to the initial state
+        executable : str, optional
+            change the overrides of an application (e.g. game.exe)
+            instead of the wineprefix ones
+
+        Raises
+        ------
+        ValueError
+            If a given override type is invalid, nothing is changed.
+        '''
+        overrides = overrides or {}
+        for override in overrides.values():
+            if override not in self._dll_overrides:
+                raise ValueError("Given override type is not supported.")
+
+        with self.registry_batch():
+            for name, override in overrides.items():
+                self.override_dll(name, override, executable=executable)
+            for name in restore or []:
+                self.override_dll(name, restore=True, executable=executable)
@@ -1,6 +1,9 @@
+import os
+import time
 from typing import NewType
 
 from .exceptions import ProtectedProcess
+from .utils import procfs
 
 Wine = NewType('Wine', object)
 
@@ -19,12 +22,27 @@ class WineProcess:
         the parent process id
     wine: Wine
         the Wine object
+    unix_pid: int (optional)
+        the Unix process id
+    unix_ppid: int (optional)
+        the Unix parent process id
+    threads: int (optional)
+        the number of threads
+
+    Once updated, cpu (percentage of a single core), memory (percentage
+    of the system memory) and rss (bytes) hold the last sample.
     '''
 
     pid = int
     name = str
     parent_pid = str
     wine = Wine
+    unix_pid = int
+    unix_ppid = int
+    threads = int
+    cpu = float
+    memory = float
+    rss = int
 
     _protected = [
         "explorer.exe",
@@ -37,11 +55,19 @@ class WineProcess:
         "conhost.exe"
     ]
 
-    def __init__(self, pid: str, name: str, wine: Wine, parent_pid: str = None):
+    def __init__(self, pid: str, name: str, wine: Wine, parent_pid: str = None,
+                 unix_pid: int = None, unix_ppid: int = None, threads: int = None):
         self.pid = self._pid(pid)
         self.name = name
         self.parent_pid = self._pid(parent_pid)
         self.wine = wine
+        self.unix_pid = unix_pid
+        self.unix_ppid = unix_ppid
+        self.threads = threads
+        self.cpu = None
+        self.memory = None
+        self.rss = None
+        self._cpu_sample = None
 
     '''
     Data check and assignment
@@ -64,61 +90,235 @@ class WineProcess:
         if pid is not None:
             return f"0x{pid}"
 
-    def _cpu_usage(self, cpu: str):
+    def _cpu_usage(self, ticks: int, start: int, now: float):
         '''
-        Get CPU usage as percentage.
+        Get CPU usage as percentage, from the CPU time consumed since the
+        previous sample (or since the process start on the first one).
 
         Parameters
         ----------
-        cpu : str
-            the CPU percentage used by the process as string
+        ticks : int
+            the CPU time used by the process (user + system) in clock ticks
+        start : int
+            the process start time, in clock ticks after boot
+        now : float
+            the system uptime in seconds
 
         Return
         ----------
-        int:
-            a valid CPU percentage usage as integer (100 = 1)
+        float:
+            the CPU percentage usage (100 = 1 core)
         '''
-        # TODO: calculate cpu percentage
-        return int(cpu)
+        if self._cpu_sample is not None and self._cpu_sample[2] == start:
+            last_ticks, last_now = self._cpu_sample[:2]
+        else:
+            last_ticks, last_now = 0, start / procfs.clock_ticks
+        self._cpu_sample = (ticks, now, start)
+
+        elapsed = now - last_now
+        if elapsed <= 0:
+            return self.cpu or 0.0
 
-    def _memory_usage(self, memory: str):
+        return (ticks - last_ticks) / procfs.clock_ticks / elapsed * 100
+
+    def _memory_usage(self, rss: int, total: int):
         '''
         Get memory usage as percentage.
 
         Parameters
         ----------
-        memory : str
-            the memory percentage used by the process as string
+        rss : int
+            the resident memory of the process in bytes
+        total : int
+            the system memory in bytes
 
         Return
         ----------
-        int:
-            a valid memory percentage usage as integer (100 = 1)
+        float:
+            the memory percentage usage (100 = all the system memory)
         '''
-        # TODO: calculate memory percentage
-        return int(memory)
+        if not total:
+            return 0.0
+        return rss / total * 100
+
+    def _sample(self, stat: list, statm: list, now: float, total: int):
+        '''
+        Store a sample of the process status.
+
+        Parameters
+        ----------
+        stat : list
+            the /proc/<pid>/stat fields (see procfs.parse_stat)
+        statm : list
+            the /proc/<pid>/statm fields
+        now : float
+            the system uptime in seconds
+        total : int
+            the system memory in bytes
+        '''
+        self.unix_ppid = int(stat[1])
+        self.threads = int(stat[17])
+        self.rss = statm[1] * procfs.page_size
+        self.cpu = self._cpu_usage(int(stat[11]) + int(stat[12]), int(stat[19]), now)
+        self.memory = self._memory_usage(self.rss, total)
 
     '''
     Process management
     '''
 
-    def kill(self):
+    def is_protected(self):
         '''
-        Kill the process.
+        Check if the process is a protected Wine process.
         '''
-        if self.name not in self._protected:
-            command = f"winedbg << END_OF_INPUTS\n\
-                attach {self.pid}\n\
-                kill\n\
-                quit\n\
-                END_OF_INPUTS"
-            self.wine.execute(command=command, comunicate=True)
-        else:
+        return self.name is not None and self.name.lower() in self._protected
+
+    def kill(self, timeout: float = 5.0):
+        '''
+        Kill the process: SIGTERM is sent and, if the process is still
+        running after the grace period, SIGKILL.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            the grace period in seconds (default is 5)
+
+        Raises
+        ------
+        ProtectedProcess
+            If the process is a protected Wine process.
+        ValueError
+            If the Unix pid of the process is unknown (it was listed with
+            winedbg).
+        '''
+        if self.is_protected():
             raise ProtectedProcess(self.name)
 
+        if self.unix_pid is None:
+            raise ValueError("The Unix pid of the process is unknown.")
+
+        procfs.terminate([self.unix_pid], timeout)
+
     def update(self):
         '''
         Update process status/data.
+
+        Return
+        ----------
+        bool:
+            False if the process is not running anymore (or its Unix pid
+            is unknown)
+        '''
+        if self.unix_pid is None:
+            return False
+
+        stat = procfs.read_stat(self.unix_pid)
+        statm = procfs.read_statm(self.unix_pid)
+        if stat is None or statm is None or stat[0] in procfs.dead_states:
+            return False
+
+        self._sample(stat, statm, procfs.uptime(), procfs.mem_total())
+        return True
+
+
+class WineProcessMonitor:
+    '''
+    Create a new object of type WineProcessMonitor to refresh the status
+    of many processes at once. The /proc files of every process are
+    opened once and read again on each update.
+
+    Parameters
+    ----------
+    processes : list, optional
+        the WineProcess objects to be monitored
+    '''
+
+    _processes = dict
+
+    def __init__(self, processes: list = None):
+        self._processes = {}
+
+        for process in processes or []:
+            self.add(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, process: WineProcess):
+        '''
+        Start monitoring a process.
+
+        Return
+        ----------
+        bool:
+            False if the process is not running (or its Unix pid is unknown)
+        '''
+        if process.unix_pid is None or process.unix_pid in self._processes:
+            return process.unix_pid is not None
+
+        fds = []
+        try:
+            for name in ("stat", "statm"):
+                fds.append(os.open(f"/proc/{process.unix_pid}/{name}", os.O_RDONLY))
+        except OSError:
+            for fd in fds:
+                os.close(fd)
+            return False
+
+        self._processes[process.unix_pid] = (process, fds)
+        return True
+
+    def remove(self, process: WineProcess):
+        '''
+        Stop monitoring a process.
+        '''
+        entry = self._processes.pop(process.unix_pid, None)
+        if entry is not None:
+            for fd in entry[1]:
+                os.close(fd)
+
+    def processes(self):
+        '''
+        Get the monitored processes.
+        '''
+        return [entry[0] for entry in self._processes.values()]
+
+    def update(self):
+        '''
+        Update the status of all the monitored processes. Processes
+        which are not running anymore are removed from the monitor.
+
+        Return
+        ----------
+        list:
+            the processes not running anymore
+        '''
+        now = procfs.uptime()
+        total = procfs.mem_total()
+        ended = []
+
+        for process, fds in list(self._processes.values()):
+            try:
+                stat = procfs.parse_stat(os.pread(fds[0], 4096, 0))
+                statm = [int(f) for f in os.pread(fds[1], 4096, 0).split()]
+            except (OSError, IndexError, ValueError):
+                # the /proc files of a process that exited can't be read
+                stat = None
+
+            if stat is None or stat[0] in procfs.dead_states:
+                ended.append(process)
+                self.remove(process)
+                continue
+
+            process._sample(stat, statm, now, total)
+
+        return ended
+
+    def close(self):
+        '''
+        Stop monitoring all the processes.
         '''
-        # TODO: update process info by pid
-        return
+        for process in self.processes():
+            self.remove(process)
@@ -0,0 +1,305 @@
+import concurrent.futures
+import os
+import selectors
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from typing import NewType
+
+from .utils import procfs
+from .utils.command import Command
+from .utils.output import Output
+from .wineprocess import WineProcess
+
+Wine = NewType('Wine', object)
+
+
+class WineRun:
+    '''
+    Create a new object of type WineRun, the handle of a program started
+    inside the wineprefix without waiting for it (see Wine.run_exe). Its
+    exit code is collected by a background reaper thread shared by all
+    the runs.
+
+    Parameters
+    ----------
+    proc : subprocess.Popen
+        the started process
+    command : Command
+        the command which started it
+    name : str
+        the program name (e.g. game.exe)
+    wine : Wine
+        the Wine object
+    output : Output
+        the output policy of the command
+
+    The exit code is available in the exit_code Future.
+    '''
+
+    pid = int
+    name = str
+    wine = Wine
+    exit_code = Future
+    started = float
+
+    def __init__(self, proc: subprocess.Popen, command: Command, name: str, wine: Wine, output: Output):
+        self.pid = proc.pid
+        self.name = name
+        self.wine = wine
+        self.exit_code = Future()
+        self.exit_code.set_running_or_notify_cancel()
+        self.started = time.monotonic()
+        self._proc = proc
+        self._command = command
+        self._output = output
+        self.__process = None
+
+        _reaper.add(self)
+
+    def __repr__(self):
+        return f"<WineRun {self.name} ({self.pid})>"
+
+    def running(self):
+        '''
+        Check if the program is still running.
+        '''
+        return not self.exit_code.done()
+
+    def wait(self, timeout: float = None):
+        '''
+        Wait for the program to exit.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            the maximum time to wait in seconds (default is no limit)
+
+        Return
+        ----------
+        int:
+            the exit code, None if the program is still running after
+            timeout
+        '''
+        try:
+            return self.exit_code.result(timeout)
+        except concurrent.futures.TimeoutError:
+            return None
+
+    def terminate(self, timeout: float = 5.0):
+        '''
+        Terminate the program, sending SIGTERM and then SIGKILL if it is
+        still running after the grace period. Other processes it started
+        in the wineprefix are not terminated (see Wine.kill_processes).
+
+        Parameters
+        ----------
+        timeout : float, optional
+            the grace period in seconds (default is 5)
+        '''
+        if not self.running():
+            return
+
+        if procfs.available():
+            procfs.terminate([self.pid], timeout)
+            return
+
+        self._proc.terminate()
+        try:
+            self._proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+
+    def process(self):
+        '''
+        Get the WineProcess of the program.
+        '''
+        if self.__process is None:
+            self.__process = WineProcess(
+                pid=None,
+                name=self.name,
+                wine=self.wine,
+                unix_pid=self.pid
+            )
+        return self.__process
+
+    def stats(self):
+        '''
+        Get the resource usage of the program.
+
+        Return
+        ----------
+        dict:
+            runtime (seconds), cpu (percentage of a single core since
+            the previous call), memory (percentage of the system memory),
+            rss (bytes) and threads; only runtime once the program exited
+        '''
+        stats = {"runtime": time.monotonic() - self.started}
+
+        process = self.process()
+        if self.running() and process.update():
+            stats.update({
+                "cpu": process.cpu,
+                "memory": process.memory,
+                "rss": process.rss,
+                "threads": process.threads,
+            })
+
+        return stats
+
+    def _ended(self, returncode: int, output_bytes: int):
+        '''
+        Called by the reaper when the program exited.
+        '''
+        try:
+            self._command.ended(returncode, output_bytes)
+        finally:
+            self.exit_code.set_result(returncode)
+
+
+class _Reaper:
+    '''
+    Collect the exit codes of the WineRun processes using a single
+    thread, waiting on pidfds where supported (polling them otherwise),
+    and read their piped output. The thread exits when there is nothing
+    left to wait for.
+    '''
+
+    _interval = 0.1
+    _chunk_size = 65536
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__selector = selectors.DefaultSelector()
+        self.__runs = {}
+        self.__polled = []
+        self.__thread = None
+        self.__wakeup = os.pipe()
+        os.set_blocking(self.__wakeup[0], False)
+        self.__selector.register(self.__wakeup[0], selectors.EVENT_READ)
+
+    def add(self, run: WineRun):
+        with self.__lock:
+            self.__runs[run.pid] = [run, None, 0]
+
+            pidfd = None
+            if hasattr(os, "pidfd_open"):
+                try:
+                    pidfd = os.pidfd_open(run.pid)
+                except OSError:
+                    pidfd = None
+
+            if pidfd is not None:
+                self.__selector.register(pidfd, selectors.EVENT_READ, ("exit", run.pid))
+                self.__runs[run.pid][1] = pidfd
+            else:
+                self.__polled.append(run.pid)
+
+            if run._proc.stdout is not None:
+                os.set_blocking(run._proc.stdout.fileno(), False)
+                self.__selector.register(run._proc.stdout, selectors.EVENT_READ, ("output", run.pid))
+
+            if self.__thread is None:
+                self.__thread = threading.Thread(
+                    target=self.__loop, name="libwine-reaper", daemon=True)
+                self.__thread.start()
+            else:
+                os.write(self.__wakeup[1], b"\0")
+
+    def __read(self, pid: int):
+        '''
+        Read the available output of a run, closing the pipe on EOF.
+        '''
+        entry = self.__runs[pid]
+        stdout = entry[0]._proc.stdout
+        if stdout is None or stdout.closed:
+            return
+
+        try:
+            while True:
+                chunk = os.read(stdout.fileno(), self._chunk_size)
+                if not chunk:
+                    self.__close_output(entry[0])
+                    return
+                entry[2] += len(chunk)
+                entry[0]._output.write(chunk, pid)
+        except BlockingIOError:
+            pass
+
+    def __close_output(self, run: WineRun):
+        stdout = run._proc.stdout
+        self.__selector.unregister(stdout)
+        stdout.close()
+        run._output.end(run.pid)
+
+    def __reap(self, pid: int):
+        '''
+        Collect the exit code of a run if it exited.
+
+        Return
+        ----------
+        tuple:
+            the run, its exit code and the output bytes read, None if
+            it is still running
+        '''
+        entry = self.__runs[pid]
+        run, pidfd = entry[0], entry[1]
+
+        returncode = run._proc.poll()
+        if returncode is None:
+            return None
+
+        # the output still buffered in the pipe, the pipe can be kept
+        # open by processes started by the program (e.g. wineserver)
+        self.__read(pid)
+        stdout = run._proc.stdout
+        if stdout is not None and not stdout.closed:
+            self.__close_output(run)
+
+        if pidfd is not None:
+            self.__selector.unregister(pidfd)
+            os.close(pidfd)
+        else:
+            self.__polled.remove(pid)
+        del self.__runs[pid]
+
+        return run, returncode, entry[2]
+
+    def __loop(self):
+        while True:
+            with self.__lock:
+                if not self.__runs:
+                    self.__thread = None
+                    return
+                timeout = self._interval if self.__polled else None
+
+            events = self.__selector.select(timeout)
+            ended = []
+
+            with self.__lock:
+                for key, _ in events:
+                    if key.data is None:
+                        try:
+                            os.read(self.__wakeup[0], self._chunk_size)
+                        except BlockingIOError:
+                            pass
+                        continue
+
+                    kind, pid = key.data
+                    if pid not in self.__runs:
+                        continue
+                    if kind == "output":
+                        self.__read(pid)
+                    else:
+                        ended.append(self.__reap(pid))
+
+                for pid in list(self.__polled):
+                    ended.append(self.__reap(pid))
+
+            # outside the lock, the hooks and callbacks can start new runs
+            for run, returncode, output_bytes in filter(None, ended):
+                run._ended(returncode, output_bytes)
+
+
+_reaper = _Reaper()
@@ -0,0 +1,45 @@
+import pytest
+
+from libwine.wine import Wine
+
+
+@pytest.fixture
+def stub(tmp_path):
+    '''
+    Write a program of the stub Wine runner (see winepath), a shell
+    script run instead of the real one.
+    '''
+    bin_dir = tmp_path / "runner" / "bin"
+
+    def write(name: str, script: str = "exit 0\n"):
+        path = bin_dir / name
+        path.write_text(f"#!/bin/sh\n{script}")
+        path.chmod(0o755)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def winepath(tmp_path, stub):
+    '''
+    A stub Wine runner, its wine64 and wineserver exit at once.
+    '''
+    path = tmp_path / "runner"
+    for d in ("bin", "lib", "share"):
+        (path / d).mkdir(parents=True)
+    stub("wine64")
+    stub("wineserver")
+    return str(path)
+
+
+@pytest.fixture
+def wineprefix(tmp_path):
+    path = tmp_path / "prefix"
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def wine(winepath, wineprefix):
+    return Wine(winepath, wineprefix)
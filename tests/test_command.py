@@ -0,0 +1,43 @@
+import os
+import signal
+
+from libwine.utils.command import Command
+
+
+def test_existing_cwd_is_used(tmp_path):
+    cwd = tmp_path / "dir with spaces"
+    cwd.mkdir()
+
+    assert Command(argv=["pwd"], cwd=str(cwd)).comunicate().strip() == str(cwd)
+
+
+def test_missing_cwd_is_created(tmp_path):
+    cwd = str(tmp_path / "new")
+
+    assert Command(argv=["pwd"], cwd=cwd).comunicate().strip() == cwd
+    assert os.path.isdir(cwd)
+
+
+def test_default_cwd():
+    assert Command(argv=["pwd"]).comunicate().strip() == os.path.realpath("/tmp")
+
+
+def test_stream_stopped_early():
+    records = []
+    cmd = Command(argv=["sh", "-c", "echo first; echo second; exec sleep 30"], post_hooks=[records.append])
+
+    lines = cmd.stream()
+    assert next(lines) == "first"
+    lines.close()
+
+    assert cmd.returncode == -signal.SIGTERM
+    assert [r.returncode for r in records] == [-signal.SIGTERM]
+
+
+def test_stream_to_the_end():
+    records = []
+    cmd = Command(argv=["sh", "-c", "echo first; echo second; exit 3"], post_hooks=[records.append])
+
+    assert list(cmd.stream(filters=["sec"])) == ["second"]
+    assert cmd.returncode == 3
+    assert [r.returncode for r in records] == [3]
@@ -0,0 +1,95 @@
+import os
+import shutil
+import stat
+
+import pytest
+
+from libwine import dedup
+from libwine.utils import clone
+
+SYSTEM32 = os.path.join("drive_c", "windows", "system32")
+
+
+@pytest.fixture
+def wineprefixes(tmp_path, monkeypatch):
+    # behave like a filesystem without reflinks (ext4)
+    monkeypatch.setattr(clone, "reflink", lambda src, dst: False)
+
+    paths = []
+    for name in ("one", "two"):
+        system32 = tmp_path / name / SYSTEM32
+        system32.mkdir(parents=True)
+        (system32 / "kernel32.dll").write_bytes(b"MZ" * 1024)
+        (system32 / f"{name}.dll").write_bytes(name.encode())
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def inodes(wineprefixes):
+    return {os.stat(os.path.join(w, SYSTEM32, "kernel32.dll")).st_ino for w in wineprefixes}
+
+
+def test_duplicates_are_kept_without_reflinks(wineprefixes):
+    report = dedup.Deduplicator(wineprefixes).run()
+
+    assert report["duplicates"] == 1
+    assert report["reflink"] == report["hardlink"] == 0
+    assert len(inodes(wineprefixes)) == 2
+    assert not [n for n in os.listdir(os.path.join(wineprefixes[1], SYSTEM32)) if n.endswith(".libwine")]
+
+
+def test_duplicates_are_hard_linked_on_request(wineprefixes):
+    report = dedup.Deduplicator(wineprefixes, hardlink=True).run()
+
+    assert report["hardlink"] == 1
+    assert report["reclaimed"] == 2048
+    assert len(inodes(wineprefixes)) == 1
+
+
+def test_files_removed_during_the_scan_are_skipped(wineprefixes, monkeypatch):
+    walk = os.walk
+
+    def walk_with_removed(path):
+        for root, dirs, names in walk(path):
+            yield root, dirs, names + ["removed.dll"]
+
+    monkeypatch.setattr(dedup.os, "walk", walk_with_removed)
+
+    report = dedup.Deduplicator(wineprefixes).run(dry_run=True)
+
+    assert report["files"] == 4
+    assert report["duplicates"] == 1
+
+
+
+def test_files_unreadable_since_the_scan_are_skipped(wineprefixes, monkeypatch):
+    hash_file = clone.hash_file
+    gone = os.path.join(wineprefixes[1], SYSTEM32, "kernel32.dll")
+
+    def hash_or_fail(path):
+        if path == gone:
+            raise PermissionError(path)
+        return hash_file(path)
+
+    monkeypatch.setattr(clone, "hash_file", hash_or_fail)
+
+    report = dedup.Deduplicator(wineprefixes, hardlink=True).run()
+
+    assert report["hashed"] == 3 # one.dll, two.dll and the first kernel32.dll
+    assert report["duplicates"] == report["hardlink"] == 0
+
+
+def test_metadata_is_not_replaced(wineprefixes, monkeypatch):
+    def reflink(src, dst):
+        shutil.copy2(src, dst)
+        return True
+
+    monkeypatch.setattr(clone, "reflink", reflink)
+    dup = os.path.join(wineprefixes[1], SYSTEM32, "kernel32.dll")
+    os.chmod(dup, 0o600)
+
+    report = dedup.Deduplicator(wineprefixes).run()
+
+    assert report["duplicates"] == 1
+    assert report["reflink"] == 0
+    assert stat.S_IMODE(os.stat(dup).st_mode) == 0o600
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from libwine.utils import procfs
+
+pytestmark = pytest.mark.skipif(not procfs.available(), reason="procfs is not available")
+
+
+def start(args, wineprefix, executable=None):
+    env = dict(os.environ, WINEPREFIX=wineprefix)
+    proc = subprocess.Popen(args, executable=executable, env=env)
+    # wait for the exec to be visible in /proc
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        cmdline = procfs._read(proc.pid, "cmdline")
+        if cmdline and cmdline.split(b"\0")[0] == os.fsencode(args[0]):
+            break
+        time.sleep(0.01)
+    return proc
+
+
+@pytest.fixture
+def processes():
+    started = []
+    yield started
+    for proc in started:
+        proc.kill()
+        proc.wait()
+
+
+def test_scan_skips_other_processes(tmp_path, processes):
+    wineprefix = str(tmp_path)
+    processes.append(start(["sleep", "30"], wineprefix))
+    processes.append(start([sys.executable, "-c", "import time; time.sleep(30)"], wineprefix))
+
+    found = procfs.scan([wineprefix])[wineprefix]
+
+    pids = {p["pid"] for p in found}
+    assert not pids & {proc.pid for proc in processes}
+    assert os.getpid() not in pids
+
+
+def test_scan_lists_windows_images(tmp_path, processes):
+    wineprefix = str(tmp_path)
+    image = start(["C:\\windows\\system32\\fake.exe", "30"], wineprefix, executable="sleep")
+    other = start(["C:\\windows\\system32\\fake.exe", "30"], str(tmp_path / "other"), executable="sleep")
+    processes.extend([image, other])
+
+    found = procfs.scan([wineprefix])[wineprefix]
+
+    assert [(p["pid"], p["name"]) for p in found] == [(image.pid, "fake.exe")]
+
+
+def test_kill_processes_spares_the_caller(wine, wineprefix, processes, monkeypatch):
+    game = start(["C:\\games\\game.exe", "30"], wineprefix, executable="sleep")
+    helper = start(["sleep", "30"], wineprefix)
+    processes.extend([game, helper])
+
+    # pretend the caller is a Wine process of the wineprefix too
+    scan = procfs.scan
+
+    def scan_with_caller(wineprefixes):
+        found = scan(wineprefixes)
+        found[wineprefix].append({"pid": os.getpid(), "name": "python.exe", "ppid": 1, "threads": 1})
+        return found
+
+    monkeypatch.setattr(procfs, "scan", scan_with_caller)
+
+    killed = wine.kill_processes(timeout=1)
+
+    assert [p.unix_pid for p in killed] == [game.pid]
+    assert game.wait(5) is not None
+    assert helper.poll() is None
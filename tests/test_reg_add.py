@@ -0,0 +1,47 @@
+import pytest
+
+from libwine.registry import RegValue
+
+KEY = "HKEY_CURRENT_USER\\Software\\Test"
+
+
+@pytest.fixture
+def hives(wineprefix):
+    with open(f"{wineprefix}/user.reg", "w") as f:
+        f.write("WINE REGISTRY Version 2\n;; All keys relative to \\\\User\\\\S-1-5-21-0-0-0-1000\n\n#arch=win64\n")
+
+
+def test_values_read_back_can_be_written(wine, hives):
+    wine.reg_add(KEY, "Name", "text")
+    wine.reg_add(KEY, "Number", "96", 1)
+    wine.reg_add(KEY, "Many", ["a", "b"], "REG_MULTI_SZ")
+    values = wine.reg_list(KEY)
+
+    other = "HKEY_CURRENT_USER\\Software\\Copy"
+    for value in values:
+        wine.reg_add(other, value.name, value)
+
+    assert wine.reg_list(other) == values
+    assert sorted((v.name, v.type_name, v.data) for v in values) == [
+        ("Many", "REG_MULTI_SZ", ["a", "b"]),
+        ("Name", "REG_SZ", "text"),
+        ("Number", "REG_DWORD", 96),
+    ]
+
+
+def test_invalid_types(wine, hives):
+    with pytest.raises(ValueError):
+        wine.reg_add(KEY, "Name", "text", 6)
+    with pytest.raises(ValueError):
+        wine.reg_add(KEY, "Name", "text", "REG_TEXT")
+
+
+def test_reg_add_command(wine, stub, tmp_path, monkeypatch):
+    args = tmp_path / "args"
+    stub("wine64", f"printf '%s\\n' \"$@\" > {args}\n")
+    monkeypatch.setattr(wine, "wineserver_running", lambda: True)
+
+    wine.reg_add(KEY, "Number", RegValue("Number", 0x4, 96))
+
+    assert args.read_text().splitlines() == [
+        "reg", "add", KEY, "/v", "Number", "/d", "0x60", "/t", "REG_DWORD", "/f"]
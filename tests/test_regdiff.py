@@ -0,0 +1,200 @@
+import random
+
+import pytest
+
+from libwine import registry, regdiff
+from libwine.regdiff import HiveDiff
+
+HEADER = "WINE REGISTRY Version 2\n;; All keys relative to \\\\Machine\n\n#arch=win64\n"
+
+
+def section(key: str, values: list, stamp: int = 1600000000):
+    lines = [f"\n[{key}] {stamp}", "#time=%x" % (stamp * 10000000)]
+    lines += [f'"{name}"={data}' for name, data in values]
+    return "\n".join(lines) + "\n"
+
+
+def hive(path, sections: list):
+    path.write_text(HEADER + "".join(section(*s) for s in sections))
+    return str(path)
+
+
+def naive_keys(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    keys = {}
+    for part in content.split("\n[")[1:]:
+        header, _, body = part.partition("\n")
+        name = registry._header_name(header[:header.rfind("]") + 1])[0]
+        values = {v.name.lower(): v for v in registry.parse_values(body)}
+        keys[name.lower()] = (name, values)
+    return keys
+
+
+def naive_diff(old_path: str, new_path: str, root: str):
+    '''
+    Compare two hives key by key.
+    '''
+    old, new = naive_keys(old_path), naive_keys(new_path)
+    changes = []
+
+    def full(name):
+        return f"{root}\\{name}"
+
+    for lower, (name, values) in old.items():
+        if lower not in new:
+            changes.append(("key_removed", full(name), None, None, None))
+            changes += [("value_removed", full(name), v.name, v, None) for v in values.values()]
+            continue
+
+        other = new[lower][1]
+        for value_lower, value in values.items():
+            if value_lower not in other:
+                changes.append(("value_removed", full(name), value.name, value, None))
+            elif (value.reg_type, value.data) != (other[value_lower].reg_type, other[value_lower].data):
+                changes.append(("value_changed", full(name), other[value_lower].name, value, other[value_lower]))
+        for value_lower, value in other.items():
+            if value_lower not in values:
+                changes.append(("value_added", full(name), value.name, None, value))
+
+    for lower, (name, values) in new.items():
+        if lower not in old:
+            changes.append(("key_added", full(name), None, None, None))
+            changes += [("value_added", full(name), v.name, None, v) for v in values.values()]
+
+    return normalize(changes)
+
+
+def normalize(changes):
+    def value(v):
+        return None if v is None else (v.name, v.reg_type, repr(v.data))
+
+    return sorted((kind, key, name, value(old), value(new)) for kind, key, name, old, new in changes)
+
+
+def hive_diff(old_path: str, new_path: str, root: str):
+    return normalize(
+        (c.kind, c.key, c.value, c.old, c.new)
+        for c in regdiff.diff_hives(old_path, new_path, root))
+
+
+def random_hive(rng: random.Random, keys: int):
+    sections = []
+    for i in range(keys):
+        values = [(f"Value{j}", f'"data {i} {j}"') for j in range(rng.randint(0, 4))]
+        if rng.random() < 0.3:
+            values.append(("Number", "dword:%08x" % rng.randint(0, 0xffff)))
+        sections.append([f"Software\\\\Vendor{i % 7}\\\\Key{i}", values, 1600000000])
+    return sections
+
+
+def mutate(rng: random.Random, sections: list):
+    sections = [[key, list(values), stamp] for key, values, stamp in sections]
+
+    for _ in range(rng.randint(1, 12)):
+        op = rng.choice(["change", "add_value", "remove_value", "add_key", "remove_key", "move_key", "stamp"])
+        i = rng.randrange(len(sections))
+        key, values, stamp = sections[i]
+
+        if op == "change" and values:
+            j = rng.randrange(len(values))
+            values[j] = (values[j][0], f'"changed {rng.random()}"')
+        elif op == "add_value":
+            values.append((f"New{rng.randint(0, 10 ** 6)}", '"new"'))
+        elif op == "remove_value" and values:
+            del values[rng.randrange(len(values))]
+        elif op == "add_key":
+            sections.insert(i, [f"Software\\\\Added{rng.randint(0, 10 ** 6)}", [("a", '"b"')], stamp])
+        elif op == "remove_key" and len(sections) > 1:
+            del sections[i]
+        elif op == "move_key":
+            moved = sections.pop(i)
+            if rng.random() < 0.5:
+                moved[1].append(("Moved", '"yes"'))
+            sections.insert(rng.randrange(len(sections) + 1), moved)
+        elif op == "stamp":
+            sections[i][2] = stamp + rng.randint(1, 10 ** 6)
+
+    return sections
+
+
+@pytest.mark.parametrize("block_size", [16, 61, 256, HiveDiff._block_size])
+@pytest.mark.parametrize("window", [64, HiveDiff._window])
+def test_matches_naive_diff(tmp_path, monkeypatch, block_size, window):
+    monkeypatch.setattr(HiveDiff, "_block_size", block_size)
+    monkeypatch.setattr(HiveDiff, "_window", window)
+
+    for seed in range(40):
+        rng = random.Random(seed)
+        old_sections = random_hive(rng, rng.randint(1, 60))
+        new_sections = mutate(rng, old_sections)
+        old = hive(tmp_path / "old.reg", old_sections)
+        new = hive(tmp_path / "new.reg", new_sections)
+
+        assert hive_diff(old, new, "HKLM") == naive_diff(old, new, "HKLM"), seed
+
+
+def test_timestamps_are_ignored(tmp_path):
+    sections = random_hive(random.Random(1), 50)
+    old = hive(tmp_path / "old.reg", sections)
+    new = hive(tmp_path / "new.reg", [[k, v, s + i + 1] for i, (k, v, s) in enumerate(sections)])
+
+    assert hive_diff(old, new, "HKLM") == []
+
+
+@pytest.mark.parametrize("block_size", [8, 32])
+def test_change_at_every_offset(tmp_path, monkeypatch, block_size):
+    # a single character changed at every position of the values, so
+    # that the differences fall on, before and after the block bounds
+    monkeypatch.setattr(HiveDiff, "_block_size", block_size)
+    sections = [
+        ["Software\\\\A", [("One", '"abcdefghij"'), ("Two", '"klmnopqrst"')], 1600000000],
+        ["Software\\\\B", [("Three", '"uvwxyz0123"')], 1600000000],
+        ["Software\\\\C", [("Four", '"456789abcd"')], 1600000000],
+    ]
+    old = hive(tmp_path / "old.reg", sections)
+
+    for i, (key, values, stamp) in enumerate(sections):
+        for j, (name, data) in enumerate(values):
+            for k in range(1, len(data) - 1):
+                changed = [[key_, list(values_), stamp_] for key_, values_, stamp_ in sections]
+                changed[i][1][j] = (name, data[:k] + "#" + data[k + 1:])
+                new = hive(tmp_path / "new.reg", changed)
+
+                diff = hive_diff(old, new, "HKLM")
+                assert diff == naive_diff(old, new, "HKLM")
+                assert [(c[0], c[2]) for c in diff] == [("value_changed", name)]
+
+
+def test_added_removed_and_moved_keys(tmp_path):
+    old = hive(tmp_path / "old.reg", [
+        ["Software\\\\Kept", [("a", '"1"')]],
+        ["Software\\\\Moved", [("b", '"2"')]],
+        ["Software\\\\Removed", [("c", '"3"')]],
+        ["Software\\\\Zzz", []],
+    ])
+    new = hive(tmp_path / "new.reg", [
+        ["Software\\\\Added", [("d", '"4"')]],
+        ["Software\\\\Kept", [("a", '"1"')]],
+        ["Software\\\\Zzz", []],
+        ["Software\\\\Moved", [("b", '"changed"')]],
+    ])
+
+    changes = {(c.kind, c.key, c.value) for c in regdiff.diff_hives(old, new, "HKLM")}
+
+    assert changes == {
+        ("key_added", "HKLM\\Software\\Added", None),
+        ("value_added", "HKLM\\Software\\Added", "d"),
+        ("key_removed", "HKLM\\Software\\Removed", None),
+        ("value_removed", "HKLM\\Software\\Removed", "c"),
+        ("value_changed", "HKLM\\Software\\Moved", "b"),
+    }
+
+
+def test_missing_hives(tmp_path):
+    new = hive(tmp_path / "new.reg", [["Software\\\\Key", [("a", '"1"')]]])
+
+    assert hive_diff(None, new, "HKLM") == naive_diff(hive(tmp_path / "empty.reg", []), new, "HKLM")
+    assert [c.kind for c in regdiff.diff_hives(new, str(tmp_path / "missing.reg"), "HKLM")] == \
+        ["key_removed", "value_removed"]
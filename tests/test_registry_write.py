@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+from libwine import registry
+
+FIXTURE = r'''WINE REGISTRY Version 2
+;; All keys relative to \\User\\S-1-5-21-0-0-0-1000
+
+#arch=win64
+
+[Control Panel\\Desktop] 1600000000
+#time=1d6e5c1c5f4b2a0
+"LogPixels"=dword:00000060
+"Wallpaper"=""
+
+[Software\\Wine\\DllOverrides] 1600000000
+#time=1d6e5c1c5f4b2a0
+"d3d11"="native"
+"dxgi"="native,builtin"
+
+[Software\\Wine\\X11 Driver] 1600000000
+#time=1d6e5c1c5f4b2a0
+"Bin"=hex:00,01,02,03,04,05,06,07,08,09,0a,0b,0c,0d,0e,0f,10,11,12,13,14,15,\
+  16,17
+"Decorated"="Y"
+'''
+
+EXPECTED = r'''WINE REGISTRY Version 2
+;; All keys relative to \\User\\S-1-5-21-0-0-0-1000
+
+#arch=win64
+
+[Control Panel\\Desktop] 1600000000
+#time=1d6e5c1c5f4b2a0
+"LogPixels"=dword:00000060
+"Wallpaper"=""
+
+[Software\\Aaa] 1700000000
+#time=1da1747c66d0000
+"n"=dword:00000005
+
+[Software\\Vendor\\\xdcn\x00efcode \x65e5\x672c] 1700000000
+#time=1da1747c66d0000
+"Name"="v\xe4lue"
+
+[Software\\Wine\\DllOverrides] 1700000000
+#time=1da1747c66d0000
+"d3d11"="builtin"
+"quo\"te\\d"="C:\\path \"x\"\n"
+
+[Software\\Wine\\X11 Driver] 1700000000
+#time=1da1747c66d0000
+@="default"
+"Bin"=hex:00,01,02,03,04,05,06,07,08,09,0a,0b,0c,0d,0e,0f,10,11,12,13,14,15,\
+  16,17
+"Decorated"="Y"
+"Exp"=str(2):"%SystemRoot%"
+"Long"=hex:00,01,02,03,04,05,06,07,08,09,0a,0b,0c,0d,0e,0f,10,11,12,13,14,15,\
+  16,17,18,19,1a,1b,1c,1d,1e,1f,20,21,22,23,24,25,26,27
+"Multi"=str(7):"a\0b\0"
+'''
+
+CHANGES = [
+    ("Software\\Wine\\DllOverrides", "d3d11", 0x1, "builtin"),
+    ("Software\\Wine\\DllOverrides", "dxgi", None, None),
+    ("Software\\Wine\\DllOverrides", 'quo"te\\d', 0x1, 'C:\\path "x"\n'),
+    ("Software\\Wine\\X11 Driver", "Long", 0x3, bytes(range(40))),
+    ("Software\\Wine\\X11 Driver", "Multi", 0x7, ["a", "b"]),
+    ("Software\\Wine\\X11 Driver", "Exp", 0x2, "%SystemRoot%"),
+    ("Software\\Wine\\X11 Driver", "", 0x1, "default"),
+    ("Software\\Vendor\\Ünïcode 日本", "Name", 0x1, "välue"),
+    ("Software\\Aaa", "n", 0x4, 5),
+    ("Software\\Zzz", "gone", None, None),
+]
+
+
+@pytest.fixture
+def hive(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry.time, "time", lambda: 1700000000.0)
+    path = tmp_path / "user.reg"
+    path.write_bytes(FIXTURE.encode("utf-8"))
+    return str(path)
+
+
+def sections(content: str):
+    return {s.split("\n", 1)[0]: s for s in content.split("\n[")}
+
+
+def test_write_hive_matches_wineserver_format(hive):
+    registry.write_hive(hive, CHANGES)
+
+    with open(hive, "rb") as f:
+        assert f.read() == EXPECTED.encode("utf-8")
+
+
+def test_write_hive_keeps_untouched_sections(hive):
+    registry.write_hive(hive, CHANGES)
+
+    with open(hive, "r", encoding="utf-8", newline="") as f:
+        written = sections(f.read())
+    original = sections(FIXTURE)
+
+    header = "Control Panel\\\\Desktop] 1600000000"
+    assert written[header] == original[header]
+    assert written[FIXTURE.split("\n[")[0].split("\n", 1)[0]] == FIXTURE.split("\n[")[0]
+
+
+def test_write_hive_round_trip(hive):
+    registry.write_hive(hive, CHANGES)
+    reader = registry.RegistryHive(hive)
+
+    try:
+        values = {v.name: v for v in reader.values("Software\\Wine\\DllOverrides")}
+        assert set(values) == {"d3d11", 'quo"te\\d'}
+        assert values['quo"te\\d'].data == 'C:\\path "x"\n'
+
+        values = {v.name: v for v in reader.values("Software\\Wine\\X11 Driver")}
+        assert values["Long"].data == bytes(range(40))
+        assert values["Multi"] == registry.RegValue("Multi", 0x7, ["a", "b"])
+        assert values["Exp"] == registry.RegValue("Exp", 0x2, "%SystemRoot%")
+        assert values[""].data == "default"
+
+        assert reader.values("software\\vendor\\ÜNÏCODE 日本")[0].data == "välue"
+        assert reader.values("Software\\Zzz") is None
+    finally:
+        reader.close()
+
+
+def test_write_hive_is_idempotent(hive):
+    registry.write_hive(hive, CHANGES)
+    registry.write_hive(hive, CHANGES)
+
+    with open(hive, "rb") as f:
+        assert f.read() == EXPECTED.encode("utf-8")
+
+
+def test_write_changes(tmp_path, hive):
+    assert registry.write_changes(str(tmp_path), [
+        ("HKEY_CURRENT_USER\\Software\\Wine\\DllOverrides", "d3d11", 0x1, "builtin"),
+    ])
+    assert registry.read_key(str(tmp_path), "HKCU\\Software\\Wine\\DllOverrides")[0].data == "builtin"
+
+
+def test_write_changes_refuses_missing_hives(tmp_path, hive):
+    with open(hive, "rb") as f:
+        before = f.read()
+
+    # system.reg doesn't exist, nothing is written
+    assert not registry.write_changes(str(tmp_path), [
+        ("HKCU\\Software\\Wine\\DllOverrides", "d3d11", 0x1, "builtin"),
+        ("HKLM\\Software\\Wine", "x", 0x1, "y"),
+    ])
+    assert not registry.write_changes(str(tmp_path), [
+        ("HKEY_CURRENT_CONFIG\\Software", "x", 0x1, "y"),
+    ])
+
+    with open(hive, "rb") as f:
+        assert f.read() == before
+    assert not os.path.exists(tmp_path / "system.reg")
@@ -0,0 +1,31 @@
+import time
+
+from libwine.utils.output import RingBuffer
+
+
+def test_session_with_a_piped_output(wine, stub):
+    # like wineserver -p, leave a daemon holding stdout
+    stub("wineserver", 'if [ "$1" = "-p" ]; then sleep 3 & fi\necho "$@"\n')
+    output = RingBuffer()
+    wine.set_output(output)
+
+    started = time.monotonic()
+    with wine.session():
+        assert time.monotonic() - started < 2
+        wine.execute(argv=["winecfg"])
+
+    assert time.monotonic() - started < 2
+    assert output.text() == ""
+
+
+def test_wineserver_wait(wine, stub, tmp_path, monkeypatch):
+    calls = tmp_path / "calls"
+    stub("wineserver", f'echo "$@" >> {calls}\n')
+    monkeypatch.setattr(wine, "wineserver_running", lambda: not calls.exists())
+
+    assert wine.wineserver_wait()
+    assert calls.read_text() == "-w\n"
+
+    # not run again once the server exited
+    assert wine.wineserver_wait()
+    assert calls.read_text() == "-w\n"
@@ -0,0 +1,25 @@
+import os
+
+from libwine.snapshot import SnapshotStore
+from libwine.utils import clone
+
+
+def test_snapshot_restore(tmp_path):
+    wineprefix = tmp_path / "prefix"
+    (wineprefix / "drive_c").mkdir(parents=True)
+    (wineprefix / "drive_c" / "game.ini").write_bytes(b"one")
+    (wineprefix / "user.reg").write_bytes(b"WINE REGISTRY Version 2\n")
+    store = SnapshotStore(str(tmp_path / "store"))
+
+    snapshot_id = store.snapshot(str(wineprefix))
+    (wineprefix / "drive_c" / "game.ini").write_bytes(b"changed")
+    (wineprefix / "drive_c" / "new.ini").write_bytes(b"new")
+
+    assert store.restore(str(wineprefix), snapshot_id) == {"restored": 1, "removed": 1, "kept": 1}
+    assert (wineprefix / "drive_c" / "game.ini").read_bytes() == b"one"
+    assert sorted(os.listdir(wineprefix / "drive_c")) == ["game.ini"]
+
+    digest = clone.hash_file(str(wineprefix / "drive_c" / "game.ini"))
+    obj = store.file(snapshot_id, os.path.join("drive_c", "game.ini"))
+    assert obj == os.path.join(str(tmp_path / "store"), "objects", digest[:2], digest)
+    assert sorted(os.listdir(os.path.dirname(obj))) == [digest]
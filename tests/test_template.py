@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from libwine import registry
+from libwine.utils import clone
+
+HIVE = r'''WINE REGISTRY Version 2
+
+[Software\\Paths] 1600000000
+#time=1d6e5c1c5f4b2a0
+"Exact"="{tpl}"
+"Child"="{tpl}/drive_c"
+"Sibling"="{tpl}2/other"
+"Dos"="Z:\\{dos}\\drive_c"
+"DosSibling"="Z:\\{dos}2\\other"
+"Multi"=str(7):"{tpl}\0{tpl}2\0"
+'''
+
+
+def hive(path: str):
+    return HIVE.format(tpl=path, dos=path.strip("/").replace("/", "\\\\"))
+
+
+def test_replace_path_matches_whole_components(tmp_path):
+    path = tmp_path / "user.reg"
+    path.write_text(hive("/tmp/rv/tpl"))
+
+    assert registry.replace_path(str(path), "/tmp/rv/tpl", "/tmp/rv/new")
+
+    values = {v.name: v.data for v in registry.RegistryHive(str(path)).values("Software\\Paths")}
+    assert values == {
+        "Exact": "/tmp/rv/new",
+        "Child": "/tmp/rv/new/drive_c",
+        "Sibling": "/tmp/rv/tpl2/other",
+        "Dos": "Z:\\tmp\\rv\\new\\drive_c",
+        "DosSibling": "Z:\\tmp\\rv\\tpl2\\other",
+        "Multi": ["/tmp/rv/new", "/tmp/rv/tpl2"],
+    }
+
+
+def test_replace_path_leaves_siblings_alone(tmp_path):
+    path = tmp_path / "user.reg"
+    path.write_text(hive("/tmp/rv/tpl2"))
+
+    assert not registry.replace_path(str(path), "/tmp/rv/tpl", "/tmp/rv/new")
+
+
+@pytest.fixture
+def template(tmp_path, monkeypatch):
+    # behave like a filesystem without reflinks (ext4)
+    monkeypatch.setattr(clone, "reflink", lambda src, dst: False)
+
+    tpl = tmp_path / "tpl"
+    (tpl / "drive_c" / "windows" / "system32").mkdir(parents=True)
+    (tpl / "drive_c" / "windows" / "system32" / "kernel32.dll").write_bytes(b"MZ")
+    (tpl / "system.reg").write_text(hive(str(tpl)))
+    return str(tpl)
+
+
+def test_create_from_template_copies_by_default(wine, wineprefix, template):
+    tpl = template
+    counts = wine.create_from_template(tpl)
+
+    dll = os.path.join("drive_c", "windows", "system32", "kernel32.dll")
+    assert counts == {"reflink": 0, "hardlink": 0, "copy": 2}
+    assert os.stat(os.path.join(wineprefix, dll)).st_ino != os.stat(os.path.join(tpl, dll)).st_ino
+    values = {v.name: v.data for v in registry.RegistryHive(os.path.join(wineprefix, "system.reg")).values("Software\\Paths")}
+    assert values["Child"] == f"{wineprefix}/drive_c"
+
+
+def test_create_from_template_hardlinks_on_request(wine, wineprefix, template):
+    tpl = template
+    counts = wine.create_from_template(tpl, hardlink=True)
+
+    dll = os.path.join("drive_c", "windows", "system32", "kernel32.dll")
+    assert counts == {"reflink": 0, "hardlink": 1, "copy": 1}
+    assert os.stat(os.path.join(wineprefix, dll)).st_ino == os.stat(os.path.join(tpl, dll)).st_ino
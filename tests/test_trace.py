@@ -0,0 +1,69 @@
+import os
+
+from libwine.utils import trace
+
+
+def operations(wine):
+    records = []
+    wine.add_hooks(post=records.append)
+    return records
+
+
+def test_public_methods_tag_their_commands(wine):
+    records = operations(wine)
+
+    wine.winecfg()
+    wine.run_exe("C:\\game.exe").wait(timeout=5)
+    wine.execute(argv=["cmd", "/c", "exit"])
+
+    assert [r.operation for r in records] == ["winecfg", "run_exe", None]
+    assert records[0].argv == [os.path.join(wine._winepath, "bin", "wine64"), "winecfg"]
+
+
+def test_session_commands(wine):
+    records = operations(wine)
+
+    with wine.session():
+        wine.winecfg()
+
+    assert [r.operation for r in records] == ["session", "winecfg", "session", "session"]
+
+
+def test_operation_outermost_wins():
+    with trace.operation("outer"):
+        with trace.operation("inner"):
+            assert trace.current_operation() == "outer"
+    assert trace.current_operation() is None
+
+
+def test_generator_methods(wine, wineprefix, stub, monkeypatch):
+    # regedit /E writes the export to C:\windows\temp
+    temp = os.path.join(wineprefix, "drive_c", "windows", "temp")
+    os.makedirs(temp)
+    stub("wine64", f'''[ "$1" = regedit ] || exit 0
+printf 'Windows Registry Editor Version 5.00\\r\\n\\r\\n[HKEY_CURRENT_USER\\\\Software]\\r\\n\\r\\n[HKEY_CURRENT_USER\\\\Software\\\\Wine]\\r\\n' \\
+    | iconv -t UTF-16 > "{temp}/${{3##*\\\\}}"
+''')
+    monkeypatch.setattr(wine, "wineserver_running", lambda: True)
+    records = operations(wine)
+
+    keys = []
+    for key, values in wine.reg_walk("HKCU\\Software"):
+        keys.append(key)
+        wine.winecfg()
+
+    assert keys == ["HKCU\\Software", "HKCU\\Software\\Wine"]
+    assert [r.operation for r in records] == ["reg_walk", "winecfg", "winecfg"]
+    assert trace.current_operation() is None
+
+
+def test_abandoned_generator_methods():
+    @trace.traced
+    def walk():
+        yield trace.current_operation()
+        yield trace.current_operation()
+
+    steps = walk()
+    assert next(steps) == "walk"
+    assert trace.current_operation() is None
+    steps.close()
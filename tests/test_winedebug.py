@@ -0,0 +1,70 @@
+from libwine.utils import winedebug
+from libwine.utils.winedebug import LogPipeline
+
+
+def test_parse_line_thread_id_only():
+    line = winedebug.parse_line("0024:fixme:ntdll:NtQuerySystemInformation info_class 99")
+
+    assert (line.pid, line.tid) == (None, "0024")
+    assert (line.cls, line.channel, line.function) == ("fixme", "ntdll", "NtQuerySystemInformation")
+    assert str(line) == "0024:fixme:ntdll:NtQuerySystemInformation info_class 99"
+
+
+def test_parse_line_process_and_thread_ids():
+    line = winedebug.parse_line("1234.567:0020:0024:err:d3d:wined3d_init failed")
+
+    assert (line.pid, line.tid, line.time) == ("0020", "0024", 1234.567)
+    assert line.message == "failed"
+    assert str(line) == "0020:0024:err:d3d:wined3d_init failed"
+
+
+def test_write_keeps_the_lines_of_each_source_apart():
+    lines = []
+    logs = LogPipeline(sink=lines.append)
+
+    logs.write(b"0024:err:one:f first\n0024:err:one:f sec", source=1)
+    logs.write(b"0030:err:two:f other\n0030:err:two:f la", source=2)
+    logs.write(b"ond\n", source=1)
+    logs.end(1)
+    logs.end(2)
+
+    assert [str(l) for l in lines] == [
+        "0024:err:one:f first",
+        "0030:err:two:f other",
+        "0024:err:one:f second",
+        "0030:err:two:f la",
+    ]
+
+
+def test_close_flushes_the_last_line():
+    lines = []
+    logs = LogPipeline(sink=lines.append)
+
+    logs.write(b"plain output\nno newline")
+    assert lines == ["plain output"]
+    logs.close()
+    assert lines == ["plain output", "no newline"]
+
+
+def test_runs_sharing_a_pipeline(wine, stub):
+    # a line written in two parts, then a last line without line break
+    stub("wine64", "printf '0024:err:%s:f a' \"$1\"\nsleep 0.2\n"
+                   "printf 'b\\n0024:err:%s:f end' \"$1\"\n")
+
+    lines = []
+    logs = LogPipeline(sink=lines.append)
+    wine.set_output(logs)
+
+    runs = [wine.start([channel]) for channel in ("one", "two")]
+    assert [run.wait(timeout=5) for run in runs] == [0, 0]
+
+    assert sorted(str(l) for l in lines) == [
+        "0024:err:one:f ab",
+        "0024:err:one:f end",
+        "0024:err:two:f ab",
+        "0024:err:two:f end",
+    ]
+    assert logs.summary()["channels"] == {
+        "one": {"err": 2, "warn": 0, "fixme": 0, "trace": 0},
+        "two": {"err": 2, "warn": 0, "fixme": 0, "trace": 0},
+    }